@@ -0,0 +1,49 @@
+import timeit
+
+from disaster import CODECS, DISASTERS, Message, MessageType
+
+# Typical traffic: a regional disaster alert, a custom alert and a mutex request
+SAMPLES = {
+    "disaster": Message(
+        msg_type=MessageType.DISASTER,
+        sender_port=6001,
+        lamport_time=1042,
+        content="Severe flood warning in effect",
+        target_areas=["HOUSTON", "NEW YORK"],
+        sender_area="HOUSTON",
+        disaster_type="FLOOD",
+        severity="HIGH",
+        tips=DISASTERS["FLOOD"]["tips"]
+    ),
+    "custom": Message(
+        msg_type=MessageType.ALERT,
+        sender_port=6001,
+        lamport_time=1043,
+        content="Power outage reported on Main St",
+        target_areas=["CHICAGO"],
+        sender_area="HOUSTON"
+    ),
+    "request": Message(
+        msg_type=MessageType.REQUEST,
+        sender_port=6001,
+        lamport_time=1044,
+        content="critical_section_request",
+        sender_area="HOUSTON"
+    ),
+}
+
+
+def bench(number=20000):
+    print(f"{'message':<10} {'codec':<7} {'bytes':>6} {'encode us':>10} {'decode us':>10}")
+    print("-" * 47)
+    for name, msg in SAMPLES.items():
+        for codec, (encode, decode) in CODECS.items():
+            payload = encode(msg)
+            assert decode(payload) == msg
+            enc = timeit.timeit(lambda: encode(msg), number=number) / number * 1e6
+            dec = timeit.timeit(lambda: decode(payload), number=number) / number * 1e6
+            print(f"{name:<10} {codec:<7} {len(payload):>6} {enc:>10.2f} {dec:>10.2f}")
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,163 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+
+from disaster import CITIES, LOCK_EXCLUSIVE, MUTEX_ALGORITHMS, LockManager, P2PNode
+
+PATTERNS = ("uniform", "hotspot", "bursty")
+HOTSPOT_SHARE = 0.8  # Fraction of hotspot acquisitions that go to resource 0
+
+
+def start_nodes(count, algorithm):
+    """Start count P2PNodes on ephemeral localhost ports, each knowing all the others"""
+    listeners = []
+    for _ in range(count):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind(("127.0.0.1", 0))
+        s.listen(128)
+        listeners.append(s)
+    ports = [s.getsockname()[1] for s in listeners]
+    areas = [CITIES[key]["name"] for key in sorted(CITIES)]
+    addresses = [("127.0.0.1", port, areas[i % len(areas)]) for i, port in enumerate(ports)]
+
+    nodes = []
+    for s, (_, port, area) in zip(listeners, addresses):
+        peers = [peer for peer in addresses if peer[1] != port]
+        node = P2PNode(port, area, peers=peers)
+        node.lock_manager = LockManager(port, node.clock, len(peers), ports, algorithm)
+        threading.Thread(target=node.listen_for_peers, args=(s,), daemon=True).start()
+        nodes.append(node)
+    return nodes
+
+
+def pick_resource(pattern, rng, resources):
+    if pattern == "hotspot" and rng.random() < HOTSPOT_SHARE:
+        return resources[0]
+    return rng.choice(resources)
+
+
+def drive(node, pattern, acquisitions, resources, cs_time, think_time, burst, barrier, timeout, seed, waits, timeouts):
+    """One node's workload: think, lock a resource, hold it for cs_time, release"""
+    rng = random.Random(seed)
+    for i in range(acquisitions):
+        if pattern == "bursty":
+            # Everyone starts a burst together, then requests back to back
+            if i % burst == 0:
+                barrier.wait()
+        elif think_time > 0:
+            time.sleep(rng.expovariate(1 / think_time))
+
+        resource = pick_resource(pattern, rng, resources)
+        started = time.perf_counter()
+        try:
+            with node.lock_manager.critical_section(resource, node.send_message, timeout, LOCK_EXCLUSIVE):
+                waits.append(time.perf_counter() - started)
+                time.sleep(cs_time)
+        except TimeoutError:
+            timeouts.append(resource)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def message_counts(nodes):
+    """Mean messages per acquisition across every lock on every node"""
+    messages = acquisitions = 0
+    for node in nodes:
+        for stats in node.lock_manager.stats().values():
+            for count, times in stats["messages_per_acquisition"].items():
+                messages += count * times
+                acquisitions += times
+    return messages / acquisitions if acquisitions else 0.0
+
+
+def run(pattern, args):
+    nodes = start_nodes(args.nodes, args.algorithm)
+    resources = [f"R{i}" for i in range(args.resources)]
+    barrier = threading.Barrier(len(nodes))
+    waits, timeouts = [], []
+    workers = [threading.Thread(target=drive, args=(node, pattern, args.acquisitions, resources, args.cs_time,
+                                                    args.think_time, args.burst, barrier, args.timeout,
+                                                    args.seed + i, waits, timeouts))
+               for i, node in enumerate(nodes)]
+
+    try:
+        started = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - started
+        messages = message_counts(nodes)
+    finally:
+        # Otherwise this pattern's listeners, heartbeats and pooled sockets keep running into the next
+        for node in nodes:
+            node.shutdown()
+
+    return {
+        "pattern": pattern,
+        "acquisitions": len(waits),
+        "timeouts": len(timeouts),
+        "elapsed_s": elapsed,
+        "acquisitions_per_sec": len(waits) / elapsed,
+        "wait_ms": {
+            "p50": percentile(waits, 50) * 1000,
+            "p95": percentile(waits, 95) * 1000,
+            "p99": percentile(waits, 99) * 1000,
+            "max": max(waits, default=0.0) * 1000,
+        },
+        "messages_per_acquisition": messages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark disaster.py mutual exclusion over localhost sockets")
+    parser.add_argument("--nodes", type=int, default=5)
+    parser.add_argument("--algorithm", choices=MUTEX_ALGORITHMS, default="ricart")
+    parser.add_argument("--pattern", choices=PATTERNS + ("all",), default="all")
+    parser.add_argument("--acquisitions", type=int, default=20, help="lock acquisitions per node")
+    parser.add_argument("--resources", type=int, default=4, help="number of named locks to spread load over")
+    parser.add_argument("--cs-time", type=float, default=0.01, help="time held in the critical section (s)")
+    parser.add_argument("--think-time", type=float, default=0.02, help="mean pause between acquisitions (s)")
+    parser.add_argument("--burst", type=int, default=5, help="back-to-back acquisitions per burst (bursty)")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_mutex.json", help="JSON results file")
+    args = parser.parse_args()
+
+    out = os.path.abspath(args.out)
+    cwd = os.getcwd()
+    patterns = PATTERNS if args.pattern == "all" else (args.pattern,)
+    results = []
+
+    # Nodes write peer_*_log.txt files and print every mutex message; keep both out of the way
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        for pattern in patterns:
+            with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+                result = run(pattern, args)
+            results.append(result)
+            wait = result["wait_ms"]
+            print(f"{pattern:<8} {result['acquisitions_per_sec']:>8.1f} acq/s  "
+                  f"wait p50/p95/p99 {wait['p50']:.1f}/{wait['p95']:.1f}/{wait['p99']:.1f} ms  "
+                  f"{result['messages_per_acquisition']:.1f} msgs/acq  timeouts={result['timeouts']}")
+        os.chdir(cwd)
+
+    config = {key: value for key, value in vars(args).items() if key != "out"}
+    with open(out, "w") as f:
+        json.dump({"config": config, "results": results}, f, indent=2)
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
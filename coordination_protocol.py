@@ -1,16 +1,21 @@
+import argparse
+import heapq
+import math
+import random
 import threading
 import time
-import random
 
 
 
 class Node:
-    def __init__(self, node_id, total_nodes):
+    def __init__(self, node_id, total_nodes, verbose=True):
         self.node_id = node_id
         self.total_nodes = total_nodes
+        self.verbose = verbose
 
 
         self.timestamp = 0
+        self.request_ts = 0
 
 
         self.requesting = False
@@ -21,10 +26,18 @@ class Node:
         self.lock = threading.Lock()
 
 
+        # Transport: anything with send(src_id, dst_id, kind, ts) -- DirectNetwork or Simulator
         self.network = None
 
+        # Called once all replies are in (the simulator uses this instead of polling)
+        self.on_grant = None
+
 
 
+    def log(self, text):
+        if self.verbose:
+            print(text)
+
     def increment_time(self):
         self.timestamp += 1
 
@@ -37,20 +50,30 @@ class Node:
         with self.lock:
             self.increment_time()
             self.requesting = True
+            self.request_ts = self.timestamp
             self.replies_needed = self.total_nodes - 1
 
-            print(f"[Node {self.node_id}] REQUEST → t={self.timestamp}")
+            self.log(f"[Node {self.node_id}] REQUEST → t={self.timestamp}")
 
         # broadcast request
-        for node in self.network:
-            if node.node_id != self.node_id:
-                node.receive_request(self.timestamp, self.node_id)
+        for node_id in range(self.total_nodes):
+            if node_id != self.node_id:
+                self.network.send(self.node_id, node_id, "request", self.request_ts)
 
+        if self.replies_needed == 0:
+            self.granted()
 
 
-    def receive_request(self, ts, requester_id):
-        time.sleep(random.uniform(0.05, 0.15))
 
+    def receive(self, kind, sender_id, ts):
+        if kind == "request":
+            self.receive_request(ts, sender_id)
+        else:
+            self.receive_reply()
+
+
+
+    def receive_request(self, ts, requester_id):
         with self.lock:
             self.update_time(ts)
 
@@ -60,30 +83,36 @@ class Node:
             if not self.requesting:
                 should_reply = True
             else:
-                my_tuple = (self.timestamp, self.node_id)
+                my_tuple = (self.request_ts, self.node_id)
                 requester_tuple = (ts, requester_id)
 
 
                 if requester_tuple < my_tuple:
                     should_reply = True
 
-            if should_reply:
-
-                for node in self.network:
-                    if node.node_id == requester_id:
-                        node.receive_reply()
-                # Debug
-                print(f"[Node {self.node_id}] REPLY → Node {requester_id}")
-            else:
+            if not should_reply:
 
                 self.deferred_replies.append(requester_id)
-                print(f"[Node {self.node_id}] DEFERRED REPLY → Node {requester_id}")
+                self.log(f"[Node {self.node_id}] DEFERRED REPLY → Node {requester_id}")
+                return
+
+        self.network.send(self.node_id, requester_id, "reply", self.timestamp)
+        # Debug
+        self.log(f"[Node {self.node_id}] REPLY → Node {requester_id}")
 
 
 
     def receive_reply(self):
         with self.lock:
             self.replies_needed -= 1
+            done = self.requesting and self.replies_needed == 0
+
+        if done:
+            self.granted()
+
+    def granted(self):
+        if self.on_grant:
+            self.on_grant(self)
 
 
 
@@ -105,15 +134,156 @@ class Node:
     def release_cs(self):
         with self.lock:
             self.requesting = False
+            deferred = self.deferred_replies
+            self.deferred_replies = []
 
 
-            for rid in self.deferred_replies:
-                for node in self.network:
-                    if node.node_id == rid:
-                        node.receive_reply()
-                print(f"[Node {self.node_id}] RELEASE → Replying to Node {rid}")
+        for rid in deferred:
+            self.network.send(self.node_id, rid, "reply", self.timestamp)
+            self.log(f"[Node {self.node_id}] RELEASE → Replying to Node {rid}")
+
+
+
+class DirectNetwork:
+    """Real threads, real time: each send sleeps for the latency, then calls the receiver"""
+
+    def __init__(self, nodes, latency=lambda: random.uniform(0.05, 0.15)):
+        self.nodes = nodes
+        self.latency = latency
+
+    def send(self, src_id, dst_id, kind, ts):
+        time.sleep(self.latency())
+        self.nodes[dst_id].receive(kind, src_id, ts)
+
 
-            self.deferred_replies = []
+
+# ===== Discrete-event simulation =====
+
+# Network latency distributions: name -> factory(mean seconds) -> sampler(rng)
+LATENCY_MODELS = {
+    "constant": lambda mean: lambda rng: mean,
+    "uniform": lambda mean: lambda rng: rng.uniform(0, 2 * mean),
+    "exponential": lambda mean: lambda rng: rng.expovariate(1 / mean),
+    "lognormal": lambda mean: lambda rng: rng.lognormvariate(math.log(mean) - 0.125, 0.5),
+}
+
+
+class Simulator:
+    """Virtual-clock network for Node: messages become events in a priority queue.
+
+    No threads and no sleeping; time only advances when the next event is popped, so
+    runs are deterministic for a given seed and limited only by the number of events.
+    `latency` is any function of a random.Random returning seconds.
+    """
+
+    def __init__(self, latency, seed=None):
+        self.now = 0.0
+        self.events = []
+        self.seq = 0
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.nodes = []
+        self.messages = 0
+
+    def schedule(self, delay, action, *args):
+        self.seq += 1
+        heapq.heappush(self.events, (self.now + delay, self.seq, action, args))
+
+    def send(self, src_id, dst_id, kind, ts):
+        self.messages += 1
+        self.schedule(self.latency(self.rng), self.nodes[dst_id].receive, kind, src_id, ts)
+
+    def run(self, until=math.inf):
+        while self.events and self.events[0][0] <= until:
+            self.now, _, action, args = heapq.heappop(self.events)
+            action(*args)
+
+
+class Workload:
+    """Each node thinks, requests the critical section, holds it, releases, repeats"""
+
+    def __init__(self, sim, nodes, entries, cs_time, think_time):
+        self.sim = sim
+        self.nodes = nodes
+        self.entries_left = entries
+        self.cs_time = cs_time
+        self.think_time = think_time
+
+        self.entries = 0
+        self.in_cs = 0
+        self.violations = 0
+        self.requested_at = {}
+        self.response_times = []
+        self.sync_delays = []
+        self.last_exit = None
+
+        for node in nodes:
+            node.on_grant = self.enter
+            self.think(node)
+
+    def think(self, node):
+        if self.entries_left > 0:
+            self.entries_left -= 1
+            self.sim.schedule(self.sim.rng.expovariate(1 / self.think_time), self.request, node)
+
+    def request(self, node):
+        self.requested_at[node.node_id] = self.sim.now
+        node.request_cs()
+
+    def enter(self, node):
+        now = self.sim.now
+        requested = self.requested_at.pop(node.node_id)
+        self.response_times.append(now - requested)
+        # Synchronization delay: exit of the previous holder to entry of one already waiting
+        if self.last_exit is not None and requested <= self.last_exit:
+            self.sync_delays.append(now - self.last_exit)
+        self.in_cs += 1
+        if self.in_cs > 1:
+            self.violations += 1
+        self.sim.schedule(self.cs_time, self.exit, node)
+
+    def exit(self, node):
+        self.in_cs -= 1
+        self.entries += 1
+        self.last_exit = self.sim.now
+        node.release_cs()
+        self.think(node)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def run_simulation(num_nodes=100, entries=1000, latency="exponential", mean_latency=0.01,
+                   cs_time=0.005, think_time=1.0, seed=0):
+    """Simulate Ricart-Agrawala on num_nodes Nodes and return its metrics"""
+    sim = Simulator(LATENCY_MODELS[latency](mean_latency), seed)
+    nodes = [Node(i, num_nodes, verbose=False) for i in range(num_nodes)]
+    for n in nodes:
+        n.network = sim
+    sim.nodes = nodes
+    workload = Workload(sim, nodes, entries, cs_time, think_time)
+
+    started = time.perf_counter()
+    sim.run()
+    wall = time.perf_counter() - started
+
+    return {
+        "nodes": num_nodes,
+        "entries": workload.entries,
+        "violations": workload.violations,
+        "messages_per_entry": sim.messages / max(workload.entries, 1),
+        "throughput": workload.entries / sim.now if sim.now else 0.0,
+        "sync_delay_mean": sum(workload.sync_delays) / len(workload.sync_delays) if workload.sync_delays else 0.0,
+        "response_p50": percentile(workload.response_times, 50),
+        "response_p99": percentile(workload.response_times, 99),
+        "simulated_seconds": sim.now,
+        "events": sim.seq,
+        "wall_seconds": wall,
+    }
 
 
 
@@ -125,8 +295,9 @@ def simulate():
     nodes = [Node(i, NUM_NODES) for i in range(NUM_NODES)]
 
 
+    network = DirectNetwork(nodes)
     for n in nodes:
-        n.network = nodes
+        n.network = network
 
 
     threads = []
@@ -153,6 +324,32 @@ def simulate_node_activity(node):
 
 
 
+def main():
+    parser = argparse.ArgumentParser(description="Ricart-Agrawala demo (threads) or discrete-event simulation")
+    parser.add_argument("--sim", action="store_true", help="run the discrete-event simulator instead of the threaded demo")
+    parser.add_argument("--nodes", type=int, default=100)
+    parser.add_argument("--entries", type=int, default=1000, help="critical-section entries to simulate")
+    parser.add_argument("--latency", choices=sorted(LATENCY_MODELS), default="exponential")
+    parser.add_argument("--mean-latency", type=float, default=0.01, help="mean one-way network delay (s)")
+    parser.add_argument("--cs-time", type=float, default=0.005, help="time spent in the critical section (s)")
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean time between a node's requests (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not args.sim:
+        simulate()
+        return
+
+    result = run_simulation(args.nodes, args.entries, args.latency, args.mean_latency,
+                            args.cs_time, args.think_time, args.seed)
+    print(f"\n===== Simulated Ricart–Agrawala: {result['nodes']} nodes, {args.latency} latency =====")
+    print(f"  entries            {result['entries']}  (mutual exclusion violations: {result['violations']})")
+    print(f"  messages/entry     {result['messages_per_entry']:.1f}")
+    print(f"  sync delay (mean)  {result['sync_delay_mean'] * 1000:.2f} ms")
+    print(f"  response p50/p99   {result['response_p50'] * 1000:.2f} / {result['response_p99'] * 1000:.2f} ms")
+    print(f"  throughput         {result['throughput']:.1f} entries/s (simulated {result['simulated_seconds']:.2f} s)")
+    print(f"  wall time          {result['wall_seconds']:.2f} s for {result['events']} events")
+
 
 if __name__ == "__main__":
-    simulate()
+    main()
@@ -1,12 +1,23 @@
+import asyncio
+import atexit
+from abc import ABC, abstractmethod
+import heapq
+import math
+import os
 import socket
 import threading
 import json
 import time
 import random
+import select
+import struct
 from enum import Enum
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, fields, replace
 from typing import Dict, List, Tuple, Optional, Set
 import queue
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 
 PEERS = []  # (host, port, area) tuples
 
@@ -98,6 +109,54 @@ DISASTERS = {
 # National Emergency (goes to everyone)
 NATIONAL_DISASTERS = ["NUCLEAR", "WAR", "BIOTERRORISM"]
 
+# Broadcast fan-out limits
+DEFAULT_MAX_IN_FLIGHT = 8
+DEFAULT_BROADCAST_DEADLINE = 5.0
+
+# Per-peer delivery results returned by send_message
+DELIVERED = "delivered"
+FAILED = "failed"
+TIMED_OUT = "timeout"
+
+# Outbound alert batching; off unless a window is set (e.g. 0.02 s with "batch 20")
+DEFAULT_BATCH_WINDOW = 0.0
+DEFAULT_BATCH_MAX_MESSAGES = 32
+DEFAULT_BATCH_MAX_BYTES = 64 * 1024
+
+# Receive pipeline: worker threads per queue and queue capacity
+DEFAULT_RECEIVE_WORKERS = {"alerts": 2, "mutex": 1, "2pc": 1}
+DEFAULT_RECEIVE_QUEUE_SIZE = 1024
+
+# Seconds demo_mutual_exclusion waits for replies before giving up
+DEFAULT_MUTEX_TIMEOUT = 30.0
+
+# Reader-writer mutex modes: shared holders may overlap, exclusive ones may not
+LOCK_SHARED = "shared"
+LOCK_EXCLUSIVE = "exclusive"
+
+# Failure detection: heartbeat period and silence before a peer is suspected.
+# Mutex replies are leases; the grantee stops relying on one LEASE_MARGIN early.
+DEFAULT_HEARTBEAT_INTERVAL = 1.0
+DEFAULT_SUSPECT_AFTER = 3.0
+DEFAULT_LEASE_DURATION = 10.0
+LEASE_MARGIN = 1.0
+
+# Seconds a token-mutex request waits before asking peers whether the token was lost
+DEFAULT_TOKEN_TIMEOUT = 5.0
+
+# Event log: lines per write, seconds between flushes, fsync policy and rotation
+DEFAULT_LOG_FLUSH_LINES = 256
+DEFAULT_LOG_FLUSH_INTERVAL = 0.2
+DEFAULT_LOG_QUEUE_SIZE = 10000
+DEFAULT_LOG_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_LOG_BACKUPS = 3
+FSYNC_POLICIES = ("none", "batch", "interval")
+
+# Gossip broadcast: each hop forwards to FANOUT random peers for up to ROUNDS hops
+DEFAULT_GOSSIP_FANOUT = 3
+DEFAULT_GOSSIP_ROUNDS = 3
+DEFAULT_GOSSIP_SEEN_CAPACITY = 4096
+
 
 # Lamport Clock for event ordering
 class LamportClock:
@@ -136,6 +195,173 @@ class MessageType(Enum):
     VOTE_YES = "vote_yes"
     VOTE_NO = "vote_no"
     ACK = "ack"
+    INQUIRE = "inquire"    # Maekawa: voter asks its grantee to give the vote back
+    YIELD = "yield"        # Maekawa: grantee returns the vote
+    FAILED = "failed"      # Maekawa: request queued behind a higher-priority one
+    TOKEN = "token"                # Token mutex: the privilege itself, with its LN vector and queue
+    TOKEN_QUERY = "token_query"    # Token mutex: ask peers whether the token still exists
+    TOKEN_STATUS = "token_status"  # Token mutex: answer to TOKEN_QUERY
+    HEARTBEAT = "heartbeat"        # Failure detector liveness ping
+
+
+MUTEX_MESSAGE_TYPES = (
+    MessageType.REQUEST, MessageType.REPLY, MessageType.RELEASE,
+    MessageType.INQUIRE, MessageType.YIELD, MessageType.FAILED,
+    MessageType.TOKEN, MessageType.TOKEN_QUERY, MessageType.TOKEN_STATUS,
+)
+
+
+# Wire framing: 1-byte frame kind + 4-byte big-endian payload length
+FRAME_HEADER = struct.Struct("!BI")
+FRAME_MESSAGE = 1
+FRAME_HELLO = 2      # First frame on a connection; payload names the codec for the rest of it
+FRAME_BATCH = 3      # Count + length-prefixed encoded messages, delivered in order
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+def encode_frame(payload: bytes, kind: int = FRAME_MESSAGE) -> bytes:
+    """Prefix a payload with its frame header"""
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {len(payload)} bytes exceeds {MAX_FRAME_SIZE}")
+    return FRAME_HEADER.pack(kind, len(payload)) + payload
+
+
+class FrameReader:
+    """Split a socket byte stream into (kind, payload) frames"""
+    
+    def __init__(self, sock: socket.socket, chunk_size: int = 65536):
+        self.sock = sock
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+    
+    def feed(self, data: bytes) -> List[Tuple[int, bytes]]:
+        """Buffer raw bytes and return every frame completed by them"""
+        self.buffer.extend(data)
+        frames = []
+        offset = 0
+        while len(self.buffer) - offset >= FRAME_HEADER.size:
+            kind, length = FRAME_HEADER.unpack_from(self.buffer, offset)
+            if length > MAX_FRAME_SIZE:
+                raise ValueError(f"Incoming frame of {length} bytes exceeds {MAX_FRAME_SIZE}")
+            end = offset + FRAME_HEADER.size + length
+            if end > len(self.buffer):
+                break
+            frames.append((kind, bytes(self.buffer[offset + FRAME_HEADER.size:end])))
+            offset = end
+        del self.buffer[:offset]
+        return frames
+    
+    def __iter__(self):
+        while True:
+            data = self.sock.recv(self.chunk_size)
+            if not data:
+                return
+            yield from self.feed(data)
+
+
+# Binary codec. Type codes are enum positions, so new MessageTypes must be appended.
+MESSAGE_TYPES_BY_CODE = list(MessageType)
+MESSAGE_TYPE_CODES = {t: i for i, t in enumerate(MESSAGE_TYPES_BY_CODE)}
+
+# Strings every node already has, sent as a one-byte index instead of text
+INTERNED_STRINGS = list(dict.fromkeys(
+    [city["name"] for city in CITIES.values()] +
+    list(DISASTERS) + NATIONAL_DISASTERS +
+    [severity for info in DISASTERS.values() for severity in info["severities"]] +
+    ["critical_section_request", "release", "shared", "exclusive"]
+))
+INTERNED_INDEX = {text: i for i, text in enumerate(INTERNED_STRINGS)}
+
+# Tips lists from the DISASTERS table, sent as a template ID
+TIP_TEMPLATES = [info["tips"] for info in DISASTERS.values()]
+
+# Optional Message fields in bitmask order (append only)
+BINARY_FIELDS = [
+    ("content", "str"),
+    ("transaction_id", "str"),
+    ("target_areas", "strlist"),
+    ("sender_area", "str"),
+    ("disaster_type", "str"),
+    ("severity", "str"),
+    ("tips", "tips"),
+    ("origin_port", "int"),
+    ("origin_time", "int"),
+    ("gossip_ttl", "int"),
+    ("resource", "str"),
+    ("request_time", "int"),
+    ("token_generation", "int"),
+    ("token_queue", "intlist"),
+    ("token_ln", "intlist"),
+    ("lock_mode", "str"),
+]
+
+BINARY_HEADER = struct.Struct("!BHqI")  # type code, sender port, lamport time, field bitmask
+_STR_LITERAL = struct.Struct("!BI")     # tag 0 + utf-8 length
+_STR_INTERNED = struct.Struct("!BB")    # tag 1 + INTERNED_STRINGS index
+_COUNT = struct.Struct("!H")
+_INT = struct.Struct("!q")
+
+
+def _pack_str(out: bytearray, value: str):
+    index = INTERNED_INDEX.get(value)
+    if index is not None:
+        out += _STR_INTERNED.pack(1, index)
+    else:
+        raw = value.encode()
+        out += _STR_LITERAL.pack(0, len(raw))
+        out += raw
+
+
+def _unpack_str(data: bytes, offset: int) -> Tuple[str, int]:
+    if data[offset] == 1:
+        _, index = _STR_INTERNED.unpack_from(data, offset)
+        return INTERNED_STRINGS[index], offset + _STR_INTERNED.size
+    _, length = _STR_LITERAL.unpack_from(data, offset)
+    start = offset + _STR_LITERAL.size
+    return data[start:start + length].decode(), start + length
+
+
+def _pack_field(out: bytearray, kind: str, value):
+    if kind == "str":
+        _pack_str(out, value)
+    elif kind == "int":
+        out += _INT.pack(value)
+    elif kind == "intlist":
+        out += _COUNT.pack(len(value))
+        for item in value:
+            out += _INT.pack(item)
+    elif kind == "tips" and value in TIP_TEMPLATES:
+        out += _STR_INTERNED.pack(1, TIP_TEMPLATES.index(value))
+    else:
+        if kind == "tips":
+            out.append(0)
+        out += _COUNT.pack(len(value))
+        for item in value:
+            _pack_str(out, item)
+
+
+def _unpack_field(data: bytes, offset: int, kind: str):
+    if kind == "str":
+        return _unpack_str(data, offset)
+    if kind == "int":
+        return _INT.unpack_from(data, offset)[0], offset + _INT.size
+    if kind == "intlist":
+        (count,) = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        items = [_INT.unpack_from(data, offset + i * _INT.size)[0] for i in range(count)]
+        return items, offset + count * _INT.size
+    if kind == "tips":
+        if data[offset] == 1:
+            _, index = _STR_INTERNED.unpack_from(data, offset)
+            return list(TIP_TEMPLATES[index]), offset + _STR_INTERNED.size
+        offset += 1
+    (count,) = _COUNT.unpack_from(data, offset)
+    offset += _COUNT.size
+    items = []
+    for _ in range(count):
+        item, offset = _unpack_str(data, offset)
+        items.append(item)
+    return items, offset
 
 
 @dataclass
@@ -150,6 +376,15 @@ class Message:
     disaster_type: Optional[str] = None
     severity: Optional[str] = None
     tips: Optional[List[str]] = None
+    origin_port: Optional[int] = None   # Gossip: originating peer, unchanged across hops
+    origin_time: Optional[int] = None   # Gossip: Lamport time at the origin
+    gossip_ttl: Optional[int] = None    # Gossip: hops left; None for direct sends
+    resource: Optional[str] = None      # Mutex: named lock; None for the global critical section
+    request_time: Optional[int] = None  # Mutex: Lamport time of the request, unchanged across messages and echoed in REPLY (and Maekawa INQUIRE/FAILED)
+    token_generation: Optional[int] = None  # Token mutex: generation of the token (bumped on regeneration)
+    token_queue: Optional[List[int]] = None # Token mutex: ports waiting for the token, in order
+    token_ln: Optional[List[int]] = None    # Token mutex: flattened (port, last granted request number) pairs
+    lock_mode: Optional[str] = None     # Mutex REQUEST: LOCK_SHARED or LOCK_EXCLUSIVE (None = exclusive)
     
     def to_json(self):
         data = asdict(self)
@@ -162,96 +397,1306 @@ class Message:
         msg_dict['msg_type'] = MessageType(msg_dict['msg_type'])
         return Message(**msg_dict)
 
+    def to_binary(self) -> bytes:
+        """Compact encoding: fixed header, then only the optional fields that are set"""
+        if not 0 <= self.sender_port <= 0xFFFF:
+            raise ValueError(f"sender_port {self.sender_port} does not fit the binary header (0-65535)")
+        body = bytearray()
+        mask = 0
+        for bit, (name, kind) in enumerate(BINARY_FIELDS):
+            value = getattr(self, name)
+            if value != _MESSAGE_DEFAULTS[name]:
+                mask |= 1 << bit
+                _pack_field(body, kind, value)
+        header = BINARY_HEADER.pack(MESSAGE_TYPE_CODES[self.msg_type], self.sender_port, self.lamport_time, mask)
+        return header + bytes(body)
+    
+    @staticmethod
+    def from_binary(data: bytes):
+        code, sender_port, lamport_time, mask = BINARY_HEADER.unpack_from(data)
+        values = {}
+        offset = BINARY_HEADER.size
+        for bit, (name, kind) in enumerate(BINARY_FIELDS):
+            if mask & (1 << bit):
+                values[name], offset = _unpack_field(data, offset, kind)
+        return Message(MESSAGE_TYPES_BY_CODE[code], sender_port, lamport_time, **values)
+
+
+_MESSAGE_DEFAULTS = {f.name: f.default for f in fields(Message)}
+
+# Wire codecs a connection can announce in its FRAME_HELLO
+CODECS = {
+    "json": (lambda msg: msg.to_json().encode(), lambda payload: Message.from_json(payload.decode())),
+    "binary": (Message.to_binary, Message.from_binary),
+}
+
+
+def encode_message(msg: Message, codec: str) -> bytes:
+    return CODECS[codec][0](msg)
+
+
+def decode_message(payload: bytes, codec: str) -> Message:
+    return CODECS[codec][1](payload)
+
+
+_BATCH_ENTRY = struct.Struct("!I")
+
+
+def encode_batch(payloads: List[bytes]) -> bytes:
+    """Pack already-encoded messages into one FRAME_BATCH frame"""
+    parts = [_COUNT.pack(len(payloads))]
+    for payload in payloads:
+        parts.append(_BATCH_ENTRY.pack(len(payload)))
+        parts.append(payload)
+    return encode_frame(b"".join(parts), FRAME_BATCH)
+
+
+def decode_batch(data: bytes) -> List[bytes]:
+    (count,) = _COUNT.unpack_from(data)
+    offset = _COUNT.size
+    payloads = []
+    for _ in range(count):
+        (length,) = _BATCH_ENTRY.unpack_from(data, offset)
+        offset += _BATCH_ENTRY.size
+        payloads.append(data[offset:offset + length])
+        offset += length
+    return payloads
+
+
+def decode_frame(kind: int, payload: bytes, codec: str) -> List[Message]:
+    """Messages carried by a FRAME_MESSAGE or FRAME_BATCH, in send order"""
+    if kind == FRAME_MESSAGE:
+        return [decode_message(payload, codec)]
+    if kind == FRAME_BATCH:
+        return [decode_message(entry, codec) for entry in decode_batch(payload)]
+    return []
+
+
+class ConnectionPool:
+    """Long-lived outbound connections, one per (host, port)"""
+    
+    def __init__(self, timeout: float = 2, hello: Optional[bytes] = None):
+        self.timeout = timeout
+        self.hello = hello
+        self.connections: Dict[Tuple[str, int], socket.socket] = {}
+        self.peer_locks: Dict[Tuple[str, int], threading.Lock] = {}
+        self.connect_counts: Dict[Tuple[str, int], int] = {}
+        self.send_counts: Dict[Tuple[str, int], int] = {}
+        self.lock = threading.Lock()
+    
+    def _peer_lock(self, addr: Tuple[str, int]) -> threading.Lock:
+        with self.lock:
+            if addr not in self.peer_locks:
+                self.peer_locks[addr] = threading.Lock()
+                self.connect_counts[addr] = 0
+                self.send_counts[addr] = 0
+            return self.peer_locks[addr]
+    
+    def _connect(self, addr: Tuple[str, int]) -> socket.socket:
+        s = socket.create_connection(addr, timeout=self.timeout)
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.hello:
+            s.sendall(self.hello)
+        self.connections[addr] = s
+        self.connect_counts[addr] += 1
+        return s
+    
+    def _drop(self, addr: Tuple[str, int]):
+        s = self.connections.pop(addr, None)
+        if s:
+            try:
+                s.close()
+            except OSError:
+                pass
+    
+    @staticmethod
+    def _is_stale(s: socket.socket) -> bool:
+        """Peers never write back on these connections, so readable means closed"""
+        try:
+            readable, _, _ = select.select([s], [], [], 0)
+            return bool(readable) and s.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
+    
+    def send(self, host: str, port: int, data: bytes):
+        """Send on the pooled connection, reconnecting once if it went bad"""
+        addr = (host, port)
+        with self._peer_lock(addr):
+            s = self.connections.get(addr)
+            if s and self._is_stale(s):
+                self._drop(addr)
+                s = None
+            if s:
+                try:
+                    s.sendall(data)
+                    self.send_counts[addr] += 1
+                    return
+                except OSError:
+                    self._drop(addr)
+            
+            s = self._connect(addr)
+            try:
+                s.sendall(data)
+            except OSError:
+                self._drop(addr)
+                raise
+            self.send_counts[addr] += 1
+    
+    def stats(self) -> Dict[Tuple[str, int], dict]:
+        """Per-peer connect count, send count and reuse ratio"""
+        with self.lock:
+            result = {}
+            for addr, sends in self.send_counts.items():
+                connects = self.connect_counts[addr]
+                reuse = (sends - connects) / sends if sends else 0.0
+                result[addr] = {
+                    'connects': connects,
+                    'sends': sends,
+                    'reuse_ratio': max(reuse, 0.0)
+                }
+            return result
+    
+    def close_all(self):
+        with self.lock:
+            addrs = list(self.connections)
+        for addr in addrs:
+            with self._peer_lock(addr):
+                self._drop(addr)
+
+
+class AsyncRuntime:
+    """asyncio event loop that serves a P2PNode instead of the blocking accept thread"""
+    
+    def __init__(self, node: "P2PNode", timeout: float = 2):
+        self.node = node
+        self.timeout = timeout
+        self.loop = asyncio.new_event_loop()
+        self.writers: Dict[Tuple[str, int], asyncio.StreamWriter] = {}
+        self.writer_locks: Dict[Tuple[str, int], asyncio.Lock] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.thread: Optional[threading.Thread] = None
+        self.tasks: Set[asyncio.Task] = set()  # Fire-and-forget sends; the loop only holds weak references
+    
+    def start(self):
+        """Run the event loop on a background thread and open the listener"""
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.node.pipeline.start()
+        self.run(self._start_server())
+    
+    async def _close_writers(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
+    
+    def close_writers(self):
+        self.run(self._close_writers())
+    
+    def stop(self):
+        async def shutdown():
+            for task in list(self.tasks):
+                task.cancel()
+            await self._close_writers()
+            if self.server:
+                self.server.close()
+                await self.server.wait_closed()
+        
+        self.run(shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+    
+    def run(self, coro, timeout: Optional[float] = None):
+        """Run a coroutine on the loop from another thread and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+    
+    def in_loop(self) -> bool:
+        return threading.current_thread() is self.thread
+    
+    async def _start_server(self):
+        self.server = await asyncio.start_server(self._handle_client, "0.0.0.0", self.node.port)
+        print(f"[PEER {self.node.port} - {self.node.area}] Listening for connections (asyncio)...")
+    
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        addr = writer.get_extra_info("peername")
+        codec = "json"
+        try:
+            while True:
+                kind, length = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+                if length > MAX_FRAME_SIZE:
+                    print(f"[PEER {self.node.port}] Dropping connection from {addr}: frame too large")
+                    break
+                payload = await reader.readexactly(length)
+                if kind == FRAME_HELLO:
+                    codec = payload.decode()
+                    if codec not in CODECS:
+                        print(f"[PEER {self.node.port}] Dropping connection from {addr}: unknown codec {codec}")
+                        break
+                    continue
+                try:
+                    messages = decode_frame(kind, payload, codec)
+                except (ValueError, KeyError, IndexError, TypeError, struct.error):
+                    print(f"[PEER {self.node.port}] Invalid {codec} message from {addr}")
+                    continue
+                for msg in messages:
+                    self.node.failure_detector.heard(msg.sender_port)
+                    if msg.msg_type == MessageType.HEARTBEAT:
+                        continue
+                    self.node.clock.update(msg.lamport_time)
+                    try:
+                        self.node.pipeline.submit(msg, block=False)
+                    except queue.Full:
+                        # Back-pressure this connection without stalling the loop
+                        await asyncio.get_running_loop().run_in_executor(None, self.node.pipeline.submit, msg)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    
+    async def _send_to(self, host: str, port: int, data: bytes) -> bool:
+        addr = (host, port)
+        lock = self.writer_locks.setdefault(addr, asyncio.Lock())
+        async with lock:
+            for _ in range(2):
+                writer = self.writers.get(addr)
+                fresh = writer is None or writer.is_closing()
+                try:
+                    if fresh:
+                        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), self.timeout)
+                        writer.write(self.node.connection_pool.hello)
+                        self.writers[addr] = writer
+                    writer.write(data)
+                    await asyncio.wait_for(writer.drain(), self.timeout)
+                    return True
+                except asyncio.CancelledError:
+                    # Broadcast deadline passed mid-send; the stream may hold a partial frame
+                    dead = self.writers.pop(addr, None)
+                    if dead:
+                        dead.close()
+                    raise
+                except (OSError, asyncio.TimeoutError):
+                    dead = self.writers.pop(addr, None)
+                    if dead:
+                        dead.close()
+                    if fresh:
+                        return False
+            return False
+    
+    async def broadcast(self, data: bytes, targets: List[Tuple[str, int, str]]) -> Dict[int, str]:
+        """Send to all targets with at most max_in_flight at once, stopping at the broadcast deadline"""
+        semaphore = asyncio.Semaphore(self.node.max_in_flight)
+    
+        async def deliver(host, port):
+            async with semaphore:
+                return port, await self._send_to(host, port, data)
+        
+        results = {port: TIMED_OUT for _, port, _ in targets}
+        if not targets:
+            return results
+        tasks = [asyncio.ensure_future(deliver(host, port)) for host, port, _ in targets]
+        done, late = await asyncio.wait(tasks, timeout=self.node.broadcast_deadline)
+        for task in late:
+            task.cancel()  # Don't let sends to slow peers pile up behind the deadline
+        for task in done:
+            port, ok = task.result()
+            results[port] = DELIVERED if ok else FAILED
+        return results
+    
+    def send(self, data: bytes, targets: List[Tuple[str, int, str]]) -> Optional[Dict[int, str]]:
+        """Schedule the send from handlers on the loop, block until done from other threads"""
+        if self.in_loop():
+            task = self.loop.create_task(self.broadcast(data, targets))
+            self.tasks.add(task)
+            task.add_done_callback(self._task_done)
+            return None
+        return self.run(self.broadcast(data, targets))
+    
+    def _task_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[PEER {self.node.port}] Background send failed: {task.exception()!r}")
+
+
+class OutboundBatcher:
+    """Per-peer outbound queues that coalesce bursts of messages into one FRAME_BATCH.
+    
+    Each enqueued message gets a Future that resolves to DELIVERED or FAILED once its
+    batch has been sent, so callers still see the real per-peer outcome.
+    """
+    
+    def __init__(self, deliver, executor: ThreadPoolExecutor, window: float = DEFAULT_BATCH_WINDOW,
+                 max_messages: int = DEFAULT_BATCH_MAX_MESSAGES, max_bytes: int = DEFAULT_BATCH_MAX_BYTES):
+        self.deliver = deliver  # deliver(host, port, frame_bytes) -> DELIVERED or FAILED
+        self.executor = executor
+        self.window = window
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        
+        # Each peer has one open batch filling up plus sealed batches waiting to go out
+        self.open: Dict[Tuple[str, int], List[Tuple[bytes, Future]]] = {}
+        self.open_bytes: Dict[Tuple[str, int], int] = {}
+        self.deadlines: Dict[Tuple[str, int], float] = {}
+        self.sealed: Dict[Tuple[str, int], deque] = {}
+        self.in_flight: Set[Tuple[str, int]] = set()  # At most one batch per peer on the wire, to keep order
+        self.batches_sent = 0
+        self.messages_sent = 0
+        self.running = True
+        
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def _seal(self, addr: Tuple[str, int]):
+        self.sealed.setdefault(addr, deque()).append(self.open.pop(addr))
+        del self.open_bytes[addr]
+        del self.deadlines[addr]
+    
+    def enqueue(self, host: str, port: int, payload: bytes) -> Future:
+        """Queue an encoded message; it goes out when the window closes or the batch fills"""
+        addr = (host, port)
+        future = Future()
+        with self.cond:
+            batch = self.open.setdefault(addr, [])
+            if not batch:
+                self.deadlines[addr] = time.monotonic() + self.window
+                self.open_bytes[addr] = 0
+            batch.append((payload, future))
+            self.open_bytes[addr] += len(payload)
+            if len(batch) >= self.max_messages or self.open_bytes[addr] >= self.max_bytes:
+                self._seal(addr)
+            self.cond.notify_all()
+        return future
+    
+    def _take_ready(self) -> List[Tuple[Tuple[str, int], List[Tuple[bytes, Future]]]]:
+        now = time.monotonic()
+        for addr in [a for a, deadline in self.deadlines.items() if deadline <= now or not self.running]:
+            self._seal(addr)
+        ready = []
+        for addr, batches in self.sealed.items():
+            if batches and addr not in self.in_flight:
+                ready.append((addr, batches.popleft()))
+                self.in_flight.add(addr)
+        return ready
+    
+    def _idle(self) -> bool:
+        return not self.open and not self.in_flight and not any(self.sealed.values())
+    
+    def _run(self):
+        while True:
+            with self.cond:
+                while True:
+                    ready = self._take_ready()
+                    if ready or (not self.running and self._idle()):
+                        break
+                    timeout = None
+                    if self.deadlines:
+                        timeout = max(min(self.deadlines.values()) - time.monotonic(), 0)
+                    self.cond.wait(timeout)
+                if not ready:
+                    return
+            
+            for addr, entries in ready:
+                self.executor.submit(self._send_batch, addr, entries)
+    
+    def _send_batch(self, addr: Tuple[str, int], entries: List[Tuple[bytes, Future]]):
+        payloads = [payload for payload, _ in entries]
+        frame = encode_frame(payloads[0]) if len(payloads) == 1 else encode_batch(payloads)
+        status = FAILED
+        try:
+            status = self.deliver(addr[0], addr[1], frame)
+        except Exception:
+            pass
+        finally:
+            with self.cond:
+                self.in_flight.discard(addr)
+                self.batches_sent += 1
+                self.messages_sent += len(payloads)
+                self.cond.notify_all()
+            for _, future in entries:
+                future.set_result(status)
+    
+    def flush(self, timeout: float = 5):
+        """Send everything queued now and wait until it has gone out"""
+        end = time.monotonic() + timeout
+        with self.cond:
+            for addr in list(self.open):
+                self._seal(addr)
+            self.cond.notify_all()
+            while not self._idle() and time.monotonic() < end:
+                self.cond.wait(0.05)
+    
+    def close(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join(timeout=5)
+    
+    def stats(self) -> dict:
+        with self.cond:
+            avg = self.messages_sent / self.batches_sent if self.batches_sent else 0.0
+            queued = sum(len(b) for b in self.open.values())
+            queued += sum(len(b) for batches in self.sealed.values() for b in batches)
+            return {
+                'batches': self.batches_sent,
+                'messages': self.messages_sent,
+                'avg_batch_size': avg,
+                'queued': queued
+            }
+
+
+class LatencyHistogram:
+    """Log-scale latency histogram (seconds) with exact count, mean and max"""
+    
+    BOUNDS = [0.0001 * 2 ** i for i in range(20)]  # 100 us .. ~52 s
+    
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+    
+    def record(self, seconds: float):
+        index = 0
+        while index < len(self.BOUNDS) and seconds > self.BOUNDS[index]:
+            index += 1
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+    
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket holding the p-th percentile"""
+        with self.lock:
+            if not self.count:
+                return 0.0
+            rank = p / 100 * self.count
+            seen = 0
+            for index, n in enumerate(self.counts):
+                seen += n
+                if seen >= rank:
+                    return min(self.BOUNDS[index], self.max) if index < len(self.BOUNDS) else self.max
+            return self.max
+    
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max
+        }
+
+
+class ReceivePipeline:
+    """Dispatch stage between connection readers and handle_message.
+    
+    Decoded messages are queued by category and served by that category's workers,
+    so a slow mutex or 2PC handler never holds up alerts. Each queue is FIFO; with a
+    single worker (the default for mutex and 2pc) messages are handled in arrival
+    order, which keeps each sender's REQUEST/REPLY/RELEASE and PREPARE/decision
+    sequence intact. Alerts use several workers, so alerts may be handled out of
+    arrival order; Lamport clocks are updated at decode time, before queueing. Both the
+    threaded listener and the asyncio runtime feed the same queues.
+    """
+    
+    CATEGORIES = {
+        MessageType.ALERT: "alerts",
+        MessageType.DISASTER: "alerts",
+        MessageType.NATIONAL: "alerts",
+        MessageType.REQUEST: "mutex",
+        MessageType.REPLY: "mutex",
+        MessageType.RELEASE: "mutex",
+        MessageType.INQUIRE: "mutex",
+        MessageType.YIELD: "mutex",
+        MessageType.FAILED: "mutex",
+        MessageType.TOKEN: "mutex",
+        MessageType.TOKEN_QUERY: "mutex",
+        MessageType.TOKEN_STATUS: "mutex",
+    }
+    
+    def __init__(self, handler, workers: Optional[Dict[str, int]] = None,
+                 queue_size: int = DEFAULT_RECEIVE_QUEUE_SIZE):
+        self.handler = handler
+        self.workers = dict(DEFAULT_RECEIVE_WORKERS, **(workers or {}))
+        self.queues: Dict[str, queue.Queue] = {name: queue.Queue(queue_size) for name in self.workers}
+        self.max_depth: Dict[str, int] = {name: 0 for name in self.workers}
+        self.depth_lock = threading.Lock()  # max_depth is updated from every reader thread
+        self.wait_times = {name: LatencyHistogram() for name in self.workers}
+        self.handler_times = {name: LatencyHistogram() for name in self.workers}
+        self.started = False
+    
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        for name, count in self.workers.items():
+            for i in range(count):
+                threading.Thread(target=self._work, args=(name,), name=f"recv-{name}-{i}", daemon=True).start()
+    
+    def stop(self):
+        """Let each worker finish what is already queued, then exit"""
+        if not self.started:
+            return
+        self.started = False
+        for name, count in self.workers.items():
+            for _ in range(count):
+                self.queues[name].put(None)
+    
+    def category(self, msg: Message) -> str:
+        return self.CATEGORIES.get(msg.msg_type, "2pc")
+    
+    def submit(self, msg: Message, block: bool = True):
+        """Queue a decoded message; blocks (back-pressuring the connection) if the queue is full.
+        With block=False a full queue raises queue.Full instead."""
+        name = self.category(msg)
+        q = self.queues[name]
+        q.put((time.monotonic(), msg), block)
+        depth = q.qsize()
+        with self.depth_lock:
+            if depth > self.max_depth[name]:
+                self.max_depth[name] = depth
+    
+    def _work(self, name: str):
+        q = self.queues[name]
+        while True:
+            item = q.get()
+            if item is None:
+                q.task_done()
+                return
+            queued_at, msg = item
+            started = time.monotonic()
+            self.wait_times[name].record(started - queued_at)
+            try:
+                self.handler(msg)
+            except Exception as e:
+                print(f"[PIPELINE] {name} handler failed on {msg.msg_type.value}: {e}")
+            finally:
+                self.handler_times[name].record(time.monotonic() - started)
+                q.task_done()
+    
+    def stats(self) -> Dict[str, dict]:
+        return {
+            name: {
+                'depth': self.queues[name].qsize(),
+                'max_depth': self.max_depth[name],
+                'workers': self.workers[name],
+                'wait': self.wait_times[name].snapshot(),
+                'handler': self.handler_times[name].snapshot()
+            }
+            for name in self.workers
+        }
+
+
+class EventLogWriter:
+    """Append-only log file written by a background thread.
+    
+    write() only enqueues; the writer thread collects lines until it has flush_lines of
+    them or flush_interval seconds have passed since the first, then writes and flushes
+    them at once. The queue is bounded, so a full queue blocks callers rather than
+    dropping lines. Lines are written in enqueue order, and write() refuses new lines
+    once close() has started. fsync is "none", "batch" (after every write) or "interval"
+    (at most every fsync_interval seconds). Past max_bytes the file rotates to
+    .1 .. .<backups>.
+    """
+    
+    def __init__(self, path: str, header: str = "", flush_lines: int = DEFAULT_LOG_FLUSH_LINES,
+                 flush_interval: float = DEFAULT_LOG_FLUSH_INTERVAL, fsync: str = "none",
+                 fsync_interval: float = 1.0, max_bytes: int = DEFAULT_LOG_MAX_BYTES,
+                 backups: int = DEFAULT_LOG_BACKUPS, queue_size: int = DEFAULT_LOG_QUEUE_SIZE):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.path = path
+        self.flush_lines = flush_lines
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.queue = queue.Queue(queue_size)
+        self.cond = threading.Condition()
+        self.close_lock = threading.Lock()  # Orders write()'s put against close()'s stop sentinel
+        self.written = 0
+        self.batches = 0
+        self.rotations = 0
+        self.rejected = 0
+        self.last_fsync = time.monotonic()
+        self.closed = False
+        
+        # Binary, so tell() and the rotation check both count bytes
+        self.header_bytes = self._encode(header)
+        self.file = open(path, 'wb')
+        self.file.write(self.header_bytes)
+        self.file.flush()
+        self.thread = threading.Thread(target=self._run, name=f"log-{path}", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+    
+    @staticmethod
+    def _encode(text: str) -> bytes:
+        return text.replace("\n", os.linesep).encode()
+    
+    def write(self, line: str) -> bool:
+        """Queue a line; False if the log is closing and the line was not accepted"""
+        with self.close_lock:
+            if self.closed:
+                self.rejected += 1
+                return False
+            self.queue.put(line)
+            return True
+    
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.flush_lines:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    line = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if line is None:
+                    stop = True
+                    break
+                batch.append(line)
+            self._write_batch(batch)
+            if stop:
+                return
+    
+    def _write_batch(self, batch: List[str]):
+        data = self._encode("".join(batch))
+        try:
+            if self.file.tell() + len(data) > self.max_bytes and self.file.tell() > len(self.header_bytes):
+                self._rotate()
+            self.file.write(data)
+            self.file.flush()
+            now = time.monotonic()
+            if self.fsync == "batch" or (self.fsync == "interval" and now - self.last_fsync >= self.fsync_interval):
+                os.fsync(self.file.fileno())
+                self.last_fsync = now
+        except OSError as e:
+            print(f"[LOG] Write to {self.path} failed: {e}")
+        with self.cond:
+            self.written += len(batch)
+            self.batches += 1
+            self.cond.notify_all()
+    
+    def _rotate(self):
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        self.file = open(self.path, 'wb')
+        self.file.write(self.header_bytes)
+        self.rotations += 1
+    
+    def close(self, timeout: float = 5.0):
+        """Stop accepting lines, write everything already queued, and close the file"""
+        with self.close_lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(None)
+        self.thread.join(timeout)
+        try:
+            if self.fsync != "none":
+                os.fsync(self.file.fileno())
+            self.file.close()
+        except (OSError, ValueError):
+            pass
+    
+    def stats(self) -> dict:
+        return {
+            'written': self.written,
+            'batches': self.batches,
+            'avg_batch_size': self.written / self.batches if self.batches else 0.0,
+            'queued': self.queue.qsize(),
+            'rotations': self.rotations,
+            'rejected': self.rejected
+        }
+
+
+class FailureDetector:
+    """Heartbeat-based suspect list.
+    
+    Any message from a peer counts as a heartbeat. A peer silent for suspect_after
+    seconds, or one we just failed to connect to, is suspected; hearing from it again
+    clears the suspicion. Listeners are called as listener(port, alive) on each change.
+    """
+    
+    def __init__(self, suspect_after: float = DEFAULT_SUSPECT_AFTER):
+        self.suspect_after = suspect_after
+        self.last_heard: Dict[int, float] = {}
+        self.suspects: Set[int] = set()
+        self.listeners = []
+        self.lock = threading.Lock()
+    
+    def watch(self, ports):
+        """Start the silence timer for peers we have not heard from yet"""
+        now = time.monotonic()
+        with self.lock:
+            for port in ports:
+                self.last_heard.setdefault(port, now)
+    
+    def heard(self, port: int):
+        with self.lock:
+            self.last_heard[port] = time.monotonic()
+            recovered = port in self.suspects
+            self.suspects.discard(port)
+        if recovered:
+            self._notify(port, True)
+    
+    def report_failure(self, port: int):
+        with self.lock:
+            if port in self.suspects:
+                return
+            self.suspects.add(port)
+        self._notify(port, False)
+    
+    def check(self):
+        """Suspect every watched peer that has been silent too long"""
+        deadline = time.monotonic() - self.suspect_after
+        with self.lock:
+            silent = [port for port, at in self.last_heard.items() if at < deadline and port not in self.suspects]
+            self.suspects.update(silent)
+        for port in silent:
+            self._notify(port, False)
+    
+    def is_alive(self, port: int) -> bool:
+        return port not in self.suspects
+    
+    def _notify(self, port: int, alive: bool):
+        print(f"[FD] Peer {port} {'recovered' if alive else 'suspected'}")
+        for listener in self.listeners:
+            listener(port, alive)
+
 
-class RicartAgrawala:
-    """Distributed Mutual Exclusion using Ricart-Agrawala algorithm"""
+class PeerIndex:
+    """Lookup tables over a snapshot of PEERS: peers by area and by port"""
+    
+    def __init__(self, peers: List[Tuple[str, int, str]], version: int = 0):
+        self.version = version  # P2PNode.peers_version the snapshot was taken at
+        self.snapshot = tuple(peers)
+        self.by_area: Dict[str, List[Tuple[str, int, str]]] = {}
+        self.by_port: Dict[int, Tuple[str, int, str]] = {}
+        for peer in self.snapshot:
+            self.by_area.setdefault(peer[2].upper(), []).append(peer)
+            self.by_port.setdefault(peer[1], peer)
+    
+    def for_areas(self, areas: List[str]) -> List[Tuple[str, int, str]]:
+        """Peers located in any of the given areas, each listed once"""
+        seen = set()
+        matches = []
+        for area in areas:
+            for peer in self.by_area.get(area.upper(), ()):
+                if peer not in seen:
+                    seen.add(peer)
+                    matches.append(peer)
+        return matches
+
+
+class GossipState:
+    """Duplicate filter and counters for gossip broadcasts"""
+    
+    def __init__(self, fanout: int = DEFAULT_GOSSIP_FANOUT, rounds: int = DEFAULT_GOSSIP_ROUNDS,
+                 capacity: int = DEFAULT_GOSSIP_SEEN_CAPACITY):
+        self.enabled = False
+        self.fanout = fanout
+        self.rounds = rounds
+        self.capacity = capacity
+        # (origin_port, origin_time) -> [copies received, copies sent] by this node, per message
+        self.seen: "OrderedDict[Tuple[int, int], List[int]]" = OrderedDict()
+        
+        self.originated = 0
+        self.delivered = 0
+        self.duplicates = 0
+        self.forwarded = 0
+        self.deliveries_by_origin: Dict[int, int] = {}
+        self.lock = threading.Lock()
+    
+    def _remember(self, key: Tuple[int, int]) -> List[int]:
+        counts = self.seen[key] = [0, 0]
+        if len(self.seen) > self.capacity:
+            self.seen.popitem(last=False)
+        return counts
+    
+    def record_origin(self, key: Tuple[int, int], sent: int):
+        with self.lock:
+            self._remember(key)[1] = sent
+            self.originated += 1
+    
+    def record_receipt(self, key: Tuple[int, int]) -> bool:
+        """Count a received gossip message; False if it was already seen"""
+        with self.lock:
+            if key in self.seen:
+                self.seen.move_to_end(key)
+                self.seen[key][0] += 1
+                self.duplicates += 1
+                return False
+            self._remember(key)[0] = 1
+            self.delivered += 1
+            self.deliveries_by_origin[key[0]] = self.deliveries_by_origin.get(key[0], 0) + 1
+            return True
+    
+    def record_forward(self, key: Tuple[int, int], sent: int):
+        with self.lock:
+            self.forwarded += sent
+            if key in self.seen:
+                self.seen[key][1] += sent
+    
+    def pick_targets(self, peers: List[Tuple[str, int, str]], exclude: Set[int]) -> List[Tuple[str, int, str]]:
+        candidates = [peer for peer in peers if peer[1] not in exclude]
+        return random.sample(candidates, min(self.fanout, len(candidates)))
+    
+    def stats(self) -> dict:
+        with self.lock:
+            received = self.delivered + self.duplicates
+            tracked = len(self.seen)
+            return {
+                'originated': self.originated,
+                'delivered': self.delivered,
+                'duplicates': self.duplicates,
+                'forwarded': self.forwarded,
+                'duplicate_rate': self.duplicates / received if received else 0.0,
+                'deliveries_by_origin': dict(self.deliveries_by_origin),
+                'tracked_messages': tracked,
+                'received_per_message': sum(c[0] for c in self.seen.values()) / tracked if tracked else 0.0,
+                'sent_per_message': sum(c[1] for c in self.seen.values()) / tracked if tracked else 0.0
+            }
+
+
+def simulate_gossip(num_nodes: int, fanout: int = DEFAULT_GOSSIP_FANOUT,
+                    rounds: int = DEFAULT_GOSSIP_ROUNDS, trials: int = 100) -> dict:
+    """Apply the gossip forwarding rule on an in-memory full mesh to estimate coverage and cost"""
+    coverage = duplicates = sends = 0
+    for _ in range(trials):
+        seen = {0}
+        frontier = [(0, None)]  # (node, node it came from)
+        for ttl in range(rounds, -1, -1):
+            next_frontier = []
+            for node, came_from in frontier:
+                candidates = [n for n in range(num_nodes) if n not in (node, came_from, 0)]
+                for target in random.sample(candidates, min(fanout, len(candidates))):
+                    sends += 1
+                    if target in seen:
+                        duplicates += 1
+                    else:
+                        seen.add(target)
+                        if ttl > 0:
+                            next_frontier.append((target, node))
+            frontier = next_frontier
+        coverage += (len(seen) - 1) / max(num_nodes - 1, 1)
+    return {
+        'coverage': coverage / trials,
+        'messages_per_broadcast': sends / trials,
+        'duplicate_rate': duplicates / sends if sends else 0.0,
+        'origin_sends': min(fanout, num_nodes - 1),
+        'direct_messages_per_broadcast': num_nodes - 1
+    }
+
+
+class DistributedMutex(ABC):
+    """Acquire/release plumbing shared by the mutual exclusion algorithms.
+    
+    Provides blocking and asyncio acquisition with timeouts, the critical_section()
+    context manager and per-acquisition metrics. Subclasses send the protocol messages:
+    _send_request, _granted, _abandon_request, _release and _acquisition_messages.
+    """
+    
+    stall_interval: Optional[float] = None
+    supports_shared = False  # Algorithms without reader-writer support treat LOCK_SHARED as exclusive
     
-    def __init__(self, node_port: int, clock: LamportClock, num_peers: int):
+    def __init__(self, node_port: int, clock: LamportClock, resource: Optional[str] = None):
         self.node_port = node_port
         self.clock = clock
-        self.num_peers = num_peers
+        self.resource = resource
         
         self.requesting = False
         self.in_critical_section = False
         self.request_timestamp = 0
-        self.replies_received = 0
-        self.deferred_replies: List[int] = []
+        self.mode = LOCK_EXCLUSIVE
         
-        self.reply_queue = queue.Queue()
         self.lock = threading.Lock()
+        self.replies_changed = threading.Condition(self.lock)
+        self.async_waiter: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = None
+    
+        # Per-acquisition metrics
+        self.wait_times = LatencyHistogram()
+        self.hold_times = LatencyHistogram()
+        self.messages_per_acquisition: Counter = Counter()
+        self.timeouts = 0
+        self.shared_acquisitions = 0
+        self.requested_at = 0.0
+        self.entered_at = 0.0
+        self.last_wait = 0.0
+    
+    @property
+    def name(self) -> str:
+        return f"lock '{self.resource}'" if self.resource else "critical section"
+    
+    @abstractmethod
+    def _granted(self) -> bool:
+        """Whether the pending request may enter now; called with self.lock held"""
+    
+    @abstractmethod
+    def _send_request(self, send_func):
+        """Start a request and send whatever asks the peers for permission"""
+    
+    @abstractmethod
+    def _abandon_request(self, send_func):
+        """Clean up after a request that timed out before it was granted"""
+    
+    @abstractmethod
+    def _release(self, send_func):
+        """Tell the peers we have left the critical section"""
+    
+    @abstractmethod
+    def _acquisition_messages(self) -> int:
+        """Protocol messages the last acquisition cost, for stats"""
     
-    def request_critical_section(self, send_func):
-        """Request access to critical section"""
+    def _notify_granted(self):
+        """Wake the waiting requester; call with self.lock held"""
+        self.replies_changed.notify_all()
+        if self.async_waiter:
+            loop, event = self.async_waiter
+            loop.call_soon_threadsafe(event.set)
+    
+    def _enter_critical_section(self):
         with self.lock:
-            self.requesting = True
-            self.request_timestamp = self.clock.tick()
-            self.replies_received = 0
+            self.in_critical_section = True
+            self.requesting = False
+            self.async_waiter = None
+            self.entered_at = time.monotonic()
+            self.last_wait = self.entered_at - self.requested_at
+        
+        self.wait_times.record(self.last_wait)
+        if self.mode == LOCK_SHARED:
+            self.shared_acquisitions += 1
+        print(f"[MUTEX] Entered {self.name} ({self.mode}) after {self.last_wait * 1000:.1f}ms")
+    
+    def _give_up(self, send_func):
+        with self.lock:
+            self.requesting = False
+            self.async_waiter = None
+            self.timeouts += 1
         
-        print(f"\n[MUTEX] Requesting critical section at Lamport time {self.request_timestamp}")
+        print(f"[MUTEX] Timed out waiting for {self.name}")
+        self._abandon_request(send_func)
+    
+    def _on_stalled(self, send_func):
+        """Called every stall_interval seconds while a request is still waiting"""
+    
+    def lease_remaining(self) -> float:
+        """Seconds the holder may still rely on its permission (unbounded without leases)"""
+        return float('inf')
+    
+    def _next_wait(self, deadline: Optional[float]) -> Optional[float]:
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if self.stall_interval is None:
+            return remaining
+        return self.stall_interval if remaining is None else min(self.stall_interval, remaining)
+    
+    def _set_mode(self, mode: str):
+        if mode not in (LOCK_SHARED, LOCK_EXCLUSIVE):
+            raise ValueError(f"Unknown lock mode: {mode}")
+        with self.lock:
+            self.mode = mode if self.supports_shared else LOCK_EXCLUSIVE
+    
+    def request_critical_section(self, send_func, timeout: Optional[float] = None,
+                                 mode: str = LOCK_EXCLUSIVE) -> bool:
+        """Request access to critical section; returns False if not granted within timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._set_mode(mode)
+        self._send_request(send_func)
         
-        msg = Message(
+        while True:
+            with self.replies_changed:
+                granted = self.replies_changed.wait_for(self._granted, self._next_wait(deadline))
+            if granted:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                self._give_up(send_func)
+                return False
+            self._on_stalled(send_func)
+        
+        self._enter_critical_section()
+        return True
+    
+    async def request_critical_section_async(self, send_func, timeout: Optional[float] = None,
+                                             mode: str = LOCK_EXCLUSIVE) -> bool:
+        """Coroutine version of request_critical_section for the asyncio runtime"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._set_mode(mode)
+        event = asyncio.Event()
+        with self.lock:
+            self.async_waiter = (asyncio.get_running_loop(), event)
+        
+        self._send_request(send_func)
+        
+        while not self._granted():
+            try:
+                await asyncio.wait_for(event.wait(), self._next_wait(deadline))
+                event.clear()
+            except asyncio.TimeoutError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    self._give_up(send_func)
+                    return False
+                self._on_stalled(send_func)
+        
+        self._enter_critical_section()
+        return True
+    
+    @contextmanager
+    def critical_section(self, send_func, timeout: Optional[float] = None, mode: str = LOCK_EXCLUSIVE):
+        """with mutex.critical_section(send): ... -- raises TimeoutError if not granted in time"""
+        if not self.request_critical_section(send_func, timeout, mode):
+            raise TimeoutError(f"{self.name} not granted within {timeout}s")
+        try:
+            yield
+        finally:
+            self.release_critical_section(send_func)
+    
+    def release_critical_section(self, send_func):
+        """Release critical section and let waiting peers in"""
+        with self.lock:
+            self.in_critical_section = False
+            messages = self._acquisition_messages()
+            hold = time.monotonic() - self.entered_at
+        
+        self.hold_times.record(hold)
+        self.messages_per_acquisition[messages] += 1
+        print(f"[MUTEX] Released {self.name}")
+        self._release(send_func)
+    
+    def handle_release(self, msg: Message, send_func):
+        """Handle incoming RELEASE message (informational unless the algorithm needs it)"""
+    
+    def membership_changed(self, port: int, alive: bool, send_func):
+        """Failure detector callback; algorithms with a fixed quorum ignore it"""
+    
+    def handle(self, msg: Message, send_func):
+        """Dispatch a mutex message addressed to this lock"""
+        if msg.msg_type == MessageType.REQUEST:
+            self.handle_request(msg, send_func)
+        elif msg.msg_type == MessageType.REPLY:
+            self.handle_reply(msg)
+        elif msg.msg_type == MessageType.RELEASE:
+            self.handle_release(msg, send_func)
+        else:
+            print(f"[MUTEX] Ignoring {msg.msg_type.value} from peer {msg.sender_port}: "
+                  f"peers must all use the same mutex algorithm")
+    
+    def stats(self) -> dict:
+        return {
+            'acquisitions': self.wait_times.count,
+            'shared': self.shared_acquisitions,
+            'timeouts': self.timeouts,
+            'wait': self.wait_times.snapshot(),
+            'hold': self.hold_times.snapshot(),
+            'messages_per_acquisition': dict(self.messages_per_acquisition)
+        }
+
+
+class RicartAgrawala(DistributedMutex):
+    """Distributed Mutual Exclusion using Ricart-Agrawala algorithm
+    
+    Reader-writer mode: REQUEST carries the requested lock mode, and a reply is only
+    deferred when the two requests conflict (either one is exclusive). Shared holders
+    therefore overlap, while a queued writer still defers every later request, so
+    readers arriving after it cannot starve it.
+    
+    Given the peer ports, the reply quorum is the set of peers not currently suspected
+    by the failure detector (once any permission we gave them has expired), and every REPLY is a lease: the grantee may only rely on it
+    for lease_duration (less LEASE_MARGIN for message delay), and the grantor treats it
+    as returned once that time has passed. A waiting request therefore never blocks on
+    a dead peer for longer than the suspicion timeout, or on a stuck holder for longer
+    than the lease. Expired replies received while still waiting are re-requested.
+    """
+    
+    supports_shared = True
+    stall_interval = DEFAULT_HEARTBEAT_INTERVAL  # Re-check leases while waiting
+    
+    def __init__(self, node_port: int, clock: LamportClock, num_peers: int, resource: Optional[str] = None,
+                 peers: Optional[List[int]] = None, lease_duration: float = DEFAULT_LEASE_DURATION):
+        super().__init__(node_port, clock, resource)
+        self.num_peers = num_peers
+        self.peers: Optional[Set[int]] = set(peers) - {node_port} if peers is not None else None
+        self.suspected: Set[int] = set()
+        self.lease_duration = lease_duration
+        
+        self.replies: Dict[int, float] = {}     # port -> when its permission arrived
+        self.granted_to: Dict[int, float] = {}  # port -> when the permission we gave it expires
+        self.deferred_replies: Dict[int, int] = {}  # port -> request_time of the request we owe a reply
+        self.lease_expires = float('inf')
+        self.lease_overruns = 0
+        self.message_count = 0  # Sent and received for the current acquisition, RELEASE excluded
+        
+        self.reply_queue = queue.Queue()
+    
+    @property
+    def replies_received(self) -> int:
+        return len(self.replies)
+    
+    def _valid_replies(self, now: float) -> Set[int]:
+        return {port for port, at in self.replies.items() if at + self.lease_duration - LEASE_MARGIN > now}
+    
+    def _granted(self) -> bool:
+        if self.peers is None:
+            return len(self.replies) >= self.num_peers
+        now = time.monotonic()
+        missing = self.peers - self._valid_replies(now)
+        # A peer whose permission from us has expired cannot still be in the critical section.
+        # Suspicion alone is not enough: a slow holder may be suspected while it still holds
+        # our permission, so a suspect only drops out once that permission has expired.
+        return all(self.granted_to.get(port, 0 if port in self.suspected else float('inf')) <= now
+                   for port in missing)
+    
+    def _request_message(self) -> Message:
+        return Message(
             msg_type=MessageType.REQUEST,
             sender_port=self.node_port,
-            lamport_time=self.request_timestamp,
-            content="critical_section_request"
+            lamport_time=self.clock.tick(),
+            content="critical_section_request",
+            resource=self.resource,
+            request_time=self.request_timestamp,
+            lock_mode=LOCK_SHARED if self.mode == LOCK_SHARED else None
         )
-        send_func(msg)
-        
-        while self.replies_received < self.num_peers:
-            time.sleep(0.1)
-        
+    
+    def _fanout(self) -> int:
+        return len(self.peers) if self.peers is not None else self.num_peers
+    
+    def _send_request(self, send_func):
+        # Peers compare request_time, which stays fixed when send_func re-stamps lamport_time
         with self.lock:
-            self.in_critical_section = True
-            self.requesting = False
+            self.requesting = True
+            self.replies = {}
+            self.message_count = self._fanout()
+            self.requested_at = time.monotonic()
+            self.request_timestamp = self.clock.tick()
+            msg = self._request_message()
         
-        print(f"[MUTEX] Entered critical section")
+        print(f"\n[MUTEX] Requesting {self.name} at Lamport time {self.request_timestamp}")
+        send_func(msg)
     
-    def release_critical_section(self, send_func):
-        """Release critical section and send deferred replies"""
+    def _enter_critical_section(self):
         with self.lock:
-            self.in_critical_section = False
-            deferred = self.deferred_replies.copy()
+            arrivals = [self.replies[port] for port in self._valid_replies(time.monotonic())]
+            self.lease_expires = min(arrivals) + self.lease_duration - LEASE_MARGIN if arrivals else float('inf')
+        super()._enter_critical_section()
+    
+    def lease_remaining(self) -> float:
+        """Seconds until the permissions we entered with expire"""
+        return self.lease_expires - time.monotonic()
+    
+    def _on_stalled(self, send_func):
+        """Re-request from peers whose reply expired before we could enter"""
+        with self.lock:
+            if not self.requesting:
+                return
+            valid = self._valid_replies(time.monotonic())
+            expired = [port for port in self.replies if port not in valid]
+            for port in expired:
+                del self.replies[port]
+            messages = [(port, self._request_message()) for port in expired]
+            self.message_count += len(messages)
+        for port, msg in messages:
+            print(f"[MUTEX] Reply from peer {port} expired; requesting again")
+            send_func(msg, specific_port=port)
+    
+    def membership_changed(self, port: int, alive: bool, send_func):
+        """Failure detector callback: drop suspects from the quorum, re-ask recovered peers"""
+        resend = None
+        with self.lock:
+            if alive:
+                self.suspected.discard(port)
+                if self.requesting and self.peers and port in self.peers and port not in self.replies:
+                    resend = self._request_message()
+                    self.message_count += 1
+            else:
+                self.suspected.add(port)
+                if self.requesting and self._granted():
+                    self._notify_granted()
+        if resend:
+            send_func(resend, specific_port=port)
+        
+    def _abandon_request(self, send_func):
+        """Give up a timed-out request; peers we deferred are no longer behind us"""
+        with self.lock:
+            deferred = dict(self.deferred_replies)
             self.deferred_replies.clear()
         
-        print(f"[MUTEX] Released critical section")
+        self._send_deferred_replies(deferred, send_func)
+    
+    def _acquisition_messages(self) -> int:
+        # Every REQUEST (re-requests included) and REPLY counted as it happened, plus the RELEASE fan-out
+        return self.message_count + self._fanout()
+        
+    def _release(self, send_func):
+        with self.lock:
+            deferred = dict(self.deferred_replies)
+            self.deferred_replies.clear()
+            if time.monotonic() > self.lease_expires:
+                self.lease_overruns += 1
+                print(f"[MUTEX] Warning: held {self.name} past its lease")
         
         msg = Message(
             msg_type=MessageType.RELEASE,
             sender_port=self.node_port,
             lamport_time=self.clock.tick(),
-            content="release"
+            content="release",
+            resource=self.resource
         )
         send_func(msg)
         
-        for port in deferred:
+        self._send_deferred_replies(deferred, send_func)
+    
+    def _send_deferred_replies(self, deferred: Dict[int, int], send_func):
+        for port, request_time in deferred.items():
             reply_msg = Message(
                 msg_type=MessageType.REPLY,
                 sender_port=self.node_port,
                 lamport_time=self.clock.tick(),
-                content=f"deferred_reply_to_{port}"
+                content=f"deferred_reply_to_{port}",
+                resource=self.resource,
+                request_time=request_time
             )
+            with self.lock:
+                self.granted_to[port] = time.monotonic() + self.lease_duration
             send_func(reply_msg, specific_port=port)
     
     def handle_request(self, msg: Message, send_func):
         """Handle incoming REQUEST message"""
+        their_time = msg.request_time if msg.request_time is not None else msg.lamport_time
         with self.lock:
-            should_defer = (
+            conflict = self.mode == LOCK_EXCLUSIVE or msg.lock_mode != LOCK_SHARED
+            should_defer = conflict and (
                 self.in_critical_section or
                 (self.requesting and 
-                 (self.request_timestamp < msg.lamport_time or
-                  (self.request_timestamp == msg.lamport_time and self.node_port < msg.sender_port)))
+                 (self.request_timestamp < their_time or
+                  (self.request_timestamp == their_time and self.node_port < msg.sender_port)))
             )
             
             if should_defer:
-                self.deferred_replies.append(msg.sender_port)
+                self.deferred_replies[msg.sender_port] = their_time
                 print(f"[MUTEX] Deferring reply to peer {msg.sender_port}")
                 return
+            self.granted_to[msg.sender_port] = time.monotonic() + self.lease_duration
         
         reply = Message(
             msg_type=MessageType.REPLY,
             sender_port=self.node_port,
             lamport_time=self.clock.tick(),
-            content=f"reply_to_{msg.sender_port}"
+            content=f"reply_to_{msg.sender_port}",
+            resource=self.resource,
+            request_time=their_time
         )
         send_func(reply, specific_port=msg.sender_port)
         print(f"[MUTEX] Sent immediate reply to peer {msg.sender_port}")
@@ -259,8 +1704,548 @@ class RicartAgrawala:
     def handle_reply(self, msg: Message):
         """Handle incoming REPLY message"""
         with self.lock:
-            self.replies_received += 1
+            if not self.requesting:
+                return  # Late reply to a request that already timed out
+            if msg.request_time != self.request_timestamp:
+                # Answers an earlier, abandoned request; counting it could let two peers in at once
+                print(f"[MUTEX] Ignoring stale reply from peer {msg.sender_port}")
+                return
+            self.replies[msg.sender_port] = time.monotonic()
+            self.message_count += 1
             print(f"[MUTEX] Received reply {self.replies_received}/{self.num_peers} from peer {msg.sender_port}")
+            if self._granted():
+                self._notify_granted()
+    
+    def handle_release(self, msg: Message, send_func):
+        """The peer has left the critical section; its lease on our permission is over"""
+        with self.lock:
+            self.granted_to.pop(msg.sender_port, None)
+    
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats['lease_overruns'] = self.lease_overruns
+        stats['suspected'] = sorted(self.suspected)
+        return stats
+    
+
+def grid_quorum(port: int, members: List[int]) -> List[int]:
+    """Maekawa grid quorum: the row and column of `port` in a ceil(sqrt(N))-wide grid of members.
+    
+    Any two quorums intersect, even when the last row is only partly filled: two peers
+    in full rows share a cell in either's row, and a peer in the last row shares the
+    cell in its own column of the other peer's (full) row.
+    """
+    members = sorted(set(members) | {port})
+    width = math.ceil(math.sqrt(len(members)))
+    row, col = divmod(members.index(port), width)
+    return sorted(set(members[row * width:(row + 1) * width]) | set(members[col::width]))
+
+
+class MaekawaMutex(DistributedMutex):
+    """Quorum-based mutual exclusion (Maekawa) with INQUIRE/YIELD/FAILED deadlock avoidance.
+    
+    A requester needs a grant (REPLY) from every member of its grid quorum (about 2*sqrt(N)
+    peers, itself included) instead of from every peer. Each peer also acts as a voter that
+    grants at most one requester at a time; requests are prioritized by (request_time, port).
+    When a higher-priority request reaches a voter that has already granted, the voter sends
+    INQUIRE to its grantee, which YIELDs the vote back once it knows (via FAILED) that it
+    cannot win yet. All peers must run the same algorithm.
+    """
+    
+    def __init__(self, node_port: int, clock: LamportClock, members: List[int], resource: Optional[str] = None):
+        super().__init__(node_port, clock, resource)
+        self.quorum = grid_quorum(node_port, members)
+        
+        # Requester state
+        self.grants: Set[int] = set()
+        self.failed = False
+        self.pending_inquiries: Set[int] = set()
+        self.message_count = 0
+        
+        # Voter state
+        self.locked_for: Optional[Tuple[int, int]] = None  # (request_time, port) holding our vote
+        self.waiting: List[Tuple[int, int]] = []           # heap of queued requests
+        self.inquired = False
+        
+        # Held from deciding on messages until they are sent, so every peer receives them in
+        # decision order even though our own votes are handled on the requesting thread
+        # (otherwise an INQUIRE can overtake the REPLY it refers to and be ignored)
+        self.order_lock = threading.RLock()
+    
+    def _granted(self) -> bool:
+        return self.grants.issuperset(self.quorum)
+    
+    def _message(self, msg_type: MessageType, request_time: Optional[int] = None) -> Message:
+        return Message(
+            msg_type=msg_type,
+            sender_port=self.node_port,
+            lamport_time=self.clock.tick(),
+            content=msg_type.value,
+            resource=self.resource,
+            request_time=request_time
+        )
+    
+    def _send(self, outbox: List[Tuple[int, Message]], send_func):
+        """Deliver queued protocol messages; our own vote is handled locally"""
+        for port, msg in outbox:
+            if port == self.node_port:
+                self.handle(msg, send_func)
+            else:
+                send_func(msg, specific_port=port)
+    
+    def _send_request(self, send_func):
+        with self.order_lock:
+            with self.lock:
+                self.requesting = True
+                self.grants = set()
+                self.failed = False
+                self.pending_inquiries = set()
+                self.request_timestamp = self.clock.tick()
+                self.requested_at = time.monotonic()
+                self.message_count = len(self.quorum) - 1
+                outbox = [(port, self._message(MessageType.REQUEST, self.request_timestamp)) for port in self.quorum]
+        
+            print(f"\n[MUTEX] Requesting {self.name} from quorum {self.quorum} at Lamport time {self.request_timestamp}")
+            self._send(outbox, send_func)
+    
+    def _abandon_request(self, send_func):
+        # RELEASE frees any vote we hold and drops our queued request everywhere else
+        with self.lock:
+            self.grants = set()
+            self.pending_inquiries = set()
+        self._release(send_func)
+    
+    def _acquisition_messages(self) -> int:
+        return self.message_count + len(self.quorum) - 1  # plus the RELEASE fan-out
+    
+    def _release(self, send_func):
+        with self.order_lock:
+            self._send([(port, self._message(MessageType.RELEASE)) for port in self.quorum], send_func)
+    
+    def _count_received(self, msg: Message):
+        if msg.sender_port != self.node_port:
+            self.message_count += 1
+    
+    def _grant_next(self, outbox: List[Tuple[int, Message]]):
+        """Give our vote to the highest-priority waiting request, if any (lock held)"""
+        self.inquired = False
+        self.locked_for = heapq.heappop(self.waiting) if self.waiting else None
+        if self.locked_for:
+            outbox.append((self.locked_for[1], self._message(MessageType.REPLY, self.locked_for[0])))
+    
+    def handle(self, msg: Message, send_func):
+        """Dispatch any Maekawa protocol message"""
+        handlers = {
+            MessageType.REQUEST: self.handle_request,
+            MessageType.RELEASE: self.handle_release,
+            MessageType.INQUIRE: self.handle_inquire,
+            MessageType.YIELD: self.handle_yield,
+            MessageType.FAILED: self.handle_failed,
+        }
+        with self.order_lock:
+            if msg.msg_type in handlers:
+                handlers[msg.msg_type](msg, send_func)
+            else:
+                super().handle(msg, send_func)
+    
+    def handle_request(self, msg: Message, send_func):
+        """Voter: grant, queue, or queue and INQUIRE the current grantee"""
+        request = (msg.request_time or msg.lamport_time, msg.sender_port)
+        outbox = []
+        with self.lock:
+            if self.locked_for is None:
+                self.locked_for = request
+                outbox.append((msg.sender_port, self._message(MessageType.REPLY, request[0])))
+            else:
+                previous_head = self.waiting[0] if self.waiting else None
+                heapq.heappush(self.waiting, request)
+                if request < self.locked_for and self.waiting[0] == request:
+                    if previous_head:
+                        outbox.append((previous_head[1], self._message(MessageType.FAILED, previous_head[0])))
+                    if not self.inquired:
+                        self.inquired = True
+                        outbox.append((self.locked_for[1], self._message(MessageType.INQUIRE, self.locked_for[0])))
+                else:
+                    outbox.append((msg.sender_port, self._message(MessageType.FAILED, request[0])))
+        self._send(outbox, send_func)
+    
+    def handle_reply(self, msg: Message):
+        """Requester: a quorum member's vote"""
+        with self.lock:
+            if not self.requesting:
+                return  # Stale grant; the RELEASE we sent when giving up returns it
+            if msg.request_time != self.request_timestamp:
+                # A vote for an earlier, abandoned request; counting it could let two peers in at once
+                print(f"[MUTEX] Ignoring stale vote from peer {msg.sender_port}")
+                return
+            self._count_received(msg)
+            self.grants.add(msg.sender_port)
+            print(f"[MUTEX] Vote {len(self.grants)}/{len(self.quorum)} from peer {msg.sender_port}")
+            if self._granted():
+                self._notify_granted()
+    
+    def handle_failed(self, msg: Message, send_func):
+        """Requester: a higher-priority request holds one of our votes; yield any inquired votes"""
+        outbox = []
+        with self.lock:
+            if not self.requesting or msg.request_time != self.request_timestamp:
+                return
+            self._count_received(msg)
+            self.failed = True
+            for voter in self.pending_inquiries & self.grants:
+                self.grants.discard(voter)
+                outbox.append((voter, self._message(MessageType.YIELD)))
+            self.pending_inquiries = set()
+        self._send_yields(outbox, send_func)
+    
+    def handle_inquire(self, msg: Message, send_func):
+        """Requester: a voter wants its vote back for a higher-priority request"""
+        outbox = []
+        with self.lock:
+            if (not self.requesting or msg.request_time != self.request_timestamp
+                    or msg.sender_port not in self.grants):
+                return  # In the critical section (RELEASE will follow), already yielded, or stale
+            self._count_received(msg)
+            if self.failed:
+                self.grants.discard(msg.sender_port)
+                outbox.append((msg.sender_port, self._message(MessageType.YIELD)))
+            else:
+                self.pending_inquiries.add(msg.sender_port)
+        self._send_yields(outbox, send_func)
+    
+    def _send_yields(self, outbox: List[Tuple[int, Message]], send_func):
+        with self.lock:
+            self.message_count += sum(1 for port, _ in outbox if port != self.node_port)
+        self._send(outbox, send_func)
+    
+    def handle_yield(self, msg: Message, send_func):
+        """Voter: our grantee gave the vote back; re-queue it and grant the head"""
+        outbox = []
+        with self.lock:
+            if not self.locked_for or self.locked_for[1] != msg.sender_port:
+                return
+            heapq.heappush(self.waiting, self.locked_for)
+            self._grant_next(outbox)
+        self._send(outbox, send_func)
+    
+    def handle_release(self, msg: Message, send_func):
+        """Voter: the grantee is done (or a waiting requester gave up)"""
+        outbox = []
+        with self.lock:
+            if self.locked_for and self.locked_for[1] == msg.sender_port:
+                self._grant_next(outbox)
+            else:
+                self.waiting = [r for r in self.waiting if r[1] != msg.sender_port]
+                heapq.heapify(self.waiting)
+        self._send(outbox, send_func)
+
+
+class SuzukiKasamiMutex(DistributedMutex):
+    """Token-based mutual exclusion (Suzuki-Kasami).
+    
+    Whoever holds the token may enter; re-entering while still holding it costs no
+    messages. Others broadcast one REQUEST carrying their request number; the holder
+    tracks them in RN and, on release, appends every peer whose RN is ahead of the
+    token's LN to the token queue and passes the token to the head.
+    
+    If a requester waits stall_interval seconds without the token, it asks every peer
+    (TOKEN_QUERY) whether the token still exists. Peers answer once per generation;
+    if all of them grant and none holds the token, the requester builds a new token
+    with a higher generation from their answers. Tokens from older generations are
+    discarded, so a token that was only delayed cannot coexist with its replacement.
+    Regeneration needs an answer from every peer the failure detector does not suspect,
+    so a crashed holder cannot block it. The lowest port starts with the token.
+    """
+    
+    stall_interval = DEFAULT_TOKEN_TIMEOUT
+    
+    def __init__(self, node_port: int, clock: LamportClock, members: List[int], resource: Optional[str] = None):
+        super().__init__(node_port, clock, resource)
+        self.members = sorted(set(members) | {node_port})
+        self.rn: Dict[int, int] = {port: 0 for port in self.members}
+        self.token: Optional[Tuple[Dict[int, int], deque]] = None  # (LN, queue) while we hold it
+        if node_port == self.members[0]:
+            self.token = ({port: 0 for port in self.members}, deque())
+        self.generation = 0             # Oldest token generation we still accept
+        self.executed = 0               # Our last satisfied request number
+        self.message_count = 0
+        self.suspected: Set[int] = set()
+        
+        # Token regeneration
+        self.promised: Tuple[int, int] = (0, 0)  # (generation, port) we agreed may regenerate
+        self.highest_seen = 0
+        self.regeneration: Optional[dict] = None
+    
+    @property
+    def has_token(self) -> bool:
+        return self.token is not None
+    
+    def _granted(self) -> bool:
+        return self.token is not None
+    
+    def _message(self, msg_type: MessageType, **fields) -> Message:
+        return Message(
+            msg_type=msg_type,
+            sender_port=self.node_port,
+            lamport_time=self.clock.tick(),
+            content=fields.pop('content', msg_type.value),
+            resource=self.resource,
+            **fields
+        )
+    
+    def _send_request(self, send_func):
+        with self.lock:
+            self.requesting = True
+            self.requested_at = time.monotonic()
+            self.message_count = 0
+            if self.token is not None:
+                print(f"\n[MUTEX] Holding the token for {self.name}; entering without messages")
+                return
+            self.rn[self.node_port] += 1
+            self.request_timestamp = self.rn[self.node_port]
+            self.message_count = len(self.members) - 1
+            msg = self._message(MessageType.REQUEST, request_time=self.request_timestamp)
+        
+        print(f"\n[MUTEX] Requesting token for {self.name} (request #{self.request_timestamp})")
+        send_func(msg)
+    
+    def _pass_token(self) -> Optional[Tuple[int, Message]]:
+        """Queue every outstanding request and hand the token to the head (lock held)"""
+        ln, waiting = self.token
+        for port in self.members:
+            if port != self.node_port and port not in waiting and self.rn.get(port, 0) > ln.get(port, 0):
+                waiting.append(port)
+        if not waiting:
+            return None
+        port = waiting.popleft()
+        msg = self._message(
+            MessageType.TOKEN,
+            token_generation=self.generation,
+            token_queue=list(waiting),
+            token_ln=[n for item in sorted(ln.items()) for n in item]
+        )
+        self.token = None
+        return port, msg
+    
+    def _finish_request(self, send_func):
+        """Mark our request satisfied in LN and pass the token on if anyone is waiting"""
+        with self.lock:
+            if self.token is None:
+                return
+            self.token[0][self.node_port] = self.rn[self.node_port]
+            self.executed = self.rn[self.node_port]
+            handoff = self._pass_token()
+        if handoff:
+            port, msg = handoff
+            send_func(msg, specific_port=port)
+    
+    def _abandon_request(self, send_func):
+        # The token may still arrive; handle_token passes it on since we are no longer requesting
+        self._finish_request(send_func)
+    
+    def _release(self, send_func):
+        self._finish_request(send_func)
+    
+    def _acquisition_messages(self) -> int:
+        return self.message_count
+    
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self.lock:
+            stats['has_token'] = self.has_token
+            stats['token_generation'] = self.generation
+        return stats
+    
+    def handle(self, msg: Message, send_func):
+        """Dispatch any token-mutex protocol message"""
+        handlers = {
+            MessageType.REQUEST: self.handle_request,
+            MessageType.TOKEN: self.handle_token,
+            MessageType.TOKEN_QUERY: self.handle_token_query,
+            MessageType.TOKEN_STATUS: self.handle_token_status,
+        }
+        if msg.msg_type in handlers:
+            handlers[msg.msg_type](msg, send_func)
+        else:
+            super().handle(msg, send_func)
+    
+    def handle_request(self, msg: Message, send_func):
+        """Record the request number; an idle holder hands the token over right away"""
+        handoff = None
+        with self.lock:
+            self.rn[msg.sender_port] = max(self.rn.get(msg.sender_port, 0), msg.request_time or 0)
+            if self.token is not None and not self.requesting and not self.in_critical_section:
+                handoff = self._pass_token()
+        if handoff:
+            port, msg = handoff
+            print(f"[MUTEX] Passing token to peer {port}")
+            send_func(msg, specific_port=port)
+    
+    def handle_token(self, msg: Message, send_func):
+        with self.lock:
+            if (msg.token_generation or 0) < self.generation:
+                print(f"[MUTEX] Discarding stale token (generation {msg.token_generation} < {self.generation})")
+                return
+            self.generation = msg.token_generation or 0
+            ln = dict(zip(msg.token_ln[::2], msg.token_ln[1::2])) if msg.token_ln else {}
+            self.token = (ln, deque(msg.token_queue or []))
+            self.regeneration = None
+            if self.requesting:
+                self.message_count += 1
+                print(f"[MUTEX] Received token from peer {msg.sender_port}")
+                self._notify_granted()
+                return
+        self._finish_request(send_func)
+    
+    def _on_stalled(self, send_func):
+        """No token yet: ask every peer whether it still exists"""
+        with self.lock:
+            if self.token is not None or not self.requesting:
+                return
+            generation = max(self.generation, self.highest_seen) + 1
+            self.generation = generation
+            self.highest_seen = generation
+            self.promised = (generation, self.node_port)
+            self.regeneration = {
+                'generation': generation,
+                'pending': set(self.members) - {self.node_port} - self.suspected,
+                'ln': {self.node_port: self.executed},
+                'queue': []
+            }
+            if self._regenerate_if_complete():
+                self._notify_granted()  # Every other member is suspected
+                return
+            self.message_count += len(self.regeneration['pending'])
+            msg = self._message(MessageType.TOKEN_QUERY, token_generation=generation)
+        
+        print(f"[MUTEX] No token after {self.stall_interval}s; querying peers (generation {generation})")
+        send_func(msg)
+    
+    def handle_token_query(self, msg: Message, send_func):
+        generation = msg.token_generation or 0
+        with self.lock:
+            if self.token is not None:
+                status = "holder"
+                self.generation = max(self.generation, generation)  # The live token takes the new generation
+            elif generation > self.generation or self.promised == (generation, msg.sender_port):
+                status = "granted"
+                self.generation = generation
+                self.promised = (generation, msg.sender_port)
+            else:
+                status = "refused"
+            reply = self._message(
+                MessageType.TOKEN_STATUS,
+                content=status,
+                token_generation=max(self.generation, self.promised[0]),
+                token_ln=[self.node_port, self.executed],
+                token_queue=[self.node_port] if self.requesting else [],
+                request_time=self.rn[self.node_port]
+            )
+        send_func(reply, specific_port=msg.sender_port)
+    
+    def handle_token_status(self, msg: Message, send_func):
+        with self.lock:
+            regeneration = self.regeneration
+            if not regeneration:
+                return
+            self.message_count += 1
+            self.highest_seen = max(self.highest_seen, msg.token_generation or 0)
+            if msg.content != "granted" or msg.token_generation != regeneration['generation']:
+                # The token is alive or someone else is regenerating; keep waiting
+                print(f"[MUTEX] Regeneration abandoned: peer {msg.sender_port} answered {msg.content}")
+                self.regeneration = None
+                return
+            regeneration['pending'].discard(msg.sender_port)
+            regeneration['ln'].update(zip(msg.token_ln[::2], msg.token_ln[1::2]))
+            regeneration['queue'].extend(msg.token_queue or [])
+            self.rn[msg.sender_port] = max(self.rn.get(msg.sender_port, 0), msg.request_time or 0)
+            if not self._regenerate_if_complete():
+                return
+            if self.requesting:
+                self._notify_granted()
+                return
+        self._finish_request(send_func)
+    
+    def _regenerate_if_complete(self) -> bool:
+        """Build the new token once no member is left to answer (lock held)"""
+        regeneration = self.regeneration
+        if regeneration['pending']:
+            return False
+        ln = {port: regeneration['ln'].get(port, 0) for port in self.members}
+        self.token = (ln, deque(port for port in regeneration['queue'] if port != self.node_port))
+        self.regeneration = None
+        print(f"[MUTEX] Regenerated token (generation {self.generation})")
+        return True
+    
+    def membership_changed(self, port: int, alive: bool, send_func):
+        """Failure detector callback: stop waiting for suspected members to regenerate"""
+        with self.lock:
+            if alive:
+                self.suspected.discard(port)
+                return
+            self.suspected.add(port)
+            if not self.regeneration or port not in self.regeneration['pending']:
+                return
+            self.regeneration['pending'].discard(port)
+            print(f"[MUTEX] Not waiting for suspected peer {port} to regenerate the token")
+            if not self._regenerate_if_complete():
+                return
+            if self.requesting:
+                self._notify_granted()
+                return
+        self._finish_request(send_func)
+
+
+MUTEX_ALGORITHMS = ("ricart", "maekawa", "token")
+
+
+class LockManager:
+    """Named locks, each an independent mutex instance (Ricart-Agrawala, Maekawa or token).
+    
+    Mutex messages carry the resource name and are routed to that instance, so
+    locks on different resources (e.g. one per city or intersection) never wait on
+    each other. The unnamed resource (None) is the original global critical section.
+    """
+    
+    def __init__(self, node_port: int, clock: LamportClock, num_peers: int,
+                 members: Optional[List[int]] = None, algorithm: str = "ricart"):
+        if algorithm not in MUTEX_ALGORITHMS:
+            raise ValueError(f"Unknown mutex algorithm: {algorithm}")
+        self.node_port = node_port
+        self.clock = clock
+        self.num_peers = num_peers
+        self.members = members or [node_port]
+        self.algorithm = algorithm
+        self.locks: Dict[Optional[str], DistributedMutex] = {}
+        self.lock = threading.Lock()
+    
+    def get(self, resource: Optional[str] = None) -> DistributedMutex:
+        resource = resource or None
+        with self.lock:
+            if resource not in self.locks:
+                if self.algorithm == "maekawa":
+                    self.locks[resource] = MaekawaMutex(self.node_port, self.clock, self.members, resource)
+                elif self.algorithm == "token":
+                    self.locks[resource] = SuzukiKasamiMutex(self.node_port, self.clock, self.members, resource)
+                else:
+                    self.locks[resource] = RicartAgrawala(self.node_port, self.clock, self.num_peers, resource,
+                                                          self.members if len(self.members) > 1 else None)
+            return self.locks[resource]
+    
+    def membership_changed(self, port: int, alive: bool, send_func):
+        with self.lock:
+            locks = list(self.locks.values())
+        for mutex in locks:
+            mutex.membership_changed(port, alive, send_func)
+    
+    def critical_section(self, resource: Optional[str], send_func, timeout: Optional[float] = None,
+                         mode: str = LOCK_EXCLUSIVE):
+        return self.get(resource).critical_section(send_func, timeout, mode)
+    
+    def stats(self) -> Dict[Optional[str], dict]:
+        with self.lock:
+            locks = list(self.locks.items())
+        return {resource: ra.stats() for resource, ra in locks}
 
 
 class TwoPhaseCommit:
@@ -271,10 +2256,10 @@ class TwoPhaseCommit:
         self.clock = clock
         self.active_transactions: Dict[str, dict] = {}
         self.prepared_transactions: Dict[str, bool] = {}
+        self.vote_waiters: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = {}
         self.lock = threading.Lock()
     
-    def start_transaction_as_coordinator(self, transaction_id: str, transaction_data: str, send_func) -> bool:
-        """Phase 1: Coordinator sends PREPARE to all participants"""
+    def _send_prepare(self, transaction_id: str, transaction_data: str, send_func):
         with self.lock:
             self.active_transactions[transaction_id] = {
                 'votes': {},
@@ -294,14 +2279,7 @@ class TwoPhaseCommit:
         )
         send_func(msg)
         
-        timeout = time.time() + 5
-        while time.time() < timeout:
-            with self.lock:
-                tx = self.active_transactions.get(transaction_id)
-                if tx and len(tx['votes']) >= len(PEERS):
-                    break
-            time.sleep(0.1)
-        
+    def _send_decision(self, transaction_id: str, send_func) -> bool:
         with self.lock:
             tx = self.active_transactions[transaction_id]
             votes = tx['votes']
@@ -323,6 +2301,38 @@ class TwoPhaseCommit:
         
         return all_yes
     
+    def start_transaction_as_coordinator(self, transaction_id: str, transaction_data: str, send_func) -> bool:
+        """Phase 1: Coordinator sends PREPARE to all participants"""
+        self._send_prepare(transaction_id, transaction_data, send_func)
+        
+        timeout = time.time() + 5
+        while time.time() < timeout:
+            with self.lock:
+                tx = self.active_transactions.get(transaction_id)
+                if tx and len(tx['votes']) >= len(PEERS):
+                    break
+            time.sleep(0.1)
+        
+        return self._send_decision(transaction_id, send_func)
+    
+    async def start_transaction_as_coordinator_async(self, transaction_id: str, transaction_data: str, send_func, timeout: float = 5) -> bool:
+        """Coroutine version of start_transaction_as_coordinator for the asyncio runtime"""
+        event = asyncio.Event()
+        with self.lock:
+            self.vote_waiters[transaction_id] = (asyncio.get_running_loop(), event)
+        
+        self._send_prepare(transaction_id, transaction_data, send_func)
+        
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.lock:
+                self.vote_waiters.pop(transaction_id, None)
+        
+        return self._send_decision(transaction_id, send_func)
+    
     def handle_prepare(self, msg: Message, send_func):
         """Participant: Handle PREPARE message"""
         tx_id = msg.transaction_id
@@ -352,6 +2362,10 @@ class TwoPhaseCommit:
             if tx_id in self.active_transactions:
                 self.active_transactions[tx_id]['votes'][msg.sender_port] = vote
                 print(f"[2PC COORDINATOR] Received {vote.upper()} vote from peer {msg.sender_port}")
+                waiter = self.vote_waiters.get(tx_id)
+                if waiter and len(self.active_transactions[tx_id]['votes']) >= len(PEERS):
+                    loop, event = waiter
+                    loop.call_soon_threadsafe(event.set)
     
     def handle_decision(self, msg: Message):
         """Participant: Handle final decision from coordinator"""
@@ -375,12 +2389,41 @@ class TwoPhaseCommit:
 
 
 class P2PNode:
-    def __init__(self, port: int, area: str):
+    # Alerts tolerate a few ms of coalescing delay; mutex and 2PC traffic is sent immediately
+    BATCHED_TYPES = (MessageType.ALERT, MessageType.DISASTER, MessageType.NATIONAL)
+    
+    def __init__(self, port: int, area: str, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 broadcast_deadline: float = DEFAULT_BROADCAST_DEADLINE, codec: str = "binary",
+                 batch_window: float = DEFAULT_BATCH_WINDOW, batch_max_messages: int = DEFAULT_BATCH_MAX_MESSAGES,
+                 batch_max_bytes: int = DEFAULT_BATCH_MAX_BYTES, receive_workers: Optional[Dict[str, int]] = None,
+                 log_fsync: str = "none", peers: Optional[List[Tuple[str, int, str]]] = None):
         self.port = port
+        self.peers = PEERS if peers is None else peers  # Own list when several nodes share a process
         self.area = area.upper()
         self.clock = LamportClock()
         self.ricart_agrawala: Optional[RicartAgrawala] = None
+        self.maekawa: Optional[MaekawaMutex] = None
+        self.suzuki_kasami: Optional[SuzukiKasamiMutex] = None
+        self.lock_manager: Optional[LockManager] = None
         self.two_phase_commit = TwoPhaseCommit(port, self.clock)
+        self.codec = codec
+        self.connection_pool = ConnectionPool(hello=encode_frame(codec.encode(), FRAME_HELLO))
+        self.async_runtime: Optional[AsyncRuntime] = None
+        self.max_in_flight = max_in_flight
+        self.broadcast_deadline = broadcast_deadline
+        self.send_executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=f"send-{port}")
+        self.gossip = GossipState()
+        self.pipeline = ReceivePipeline(self.handle_message, receive_workers)
+        self.failure_detector = FailureDetector()
+        self.failure_detector.listeners.append(self.membership_changed)
+        self.heartbeats_enabled = False
+        self.listener: Optional[socket.socket] = None
+        self.lock = threading.Lock()  # Guards peers_version, peer_index rebuilds and peers_skipped
+        self.peers_version = 0        # Bumped by add_peer so the index is rebuilt only on change
+        self.peer_index = PeerIndex(self.peers)
+        self.peers_skipped = 0  # Sends avoided by area routing
+        self.batcher = OutboundBatcher(self._send_frame, self.send_executor, batch_window,
+                                       batch_max_messages, batch_max_bytes)
         self.log_file = f"peer_{port}_{area}_log.txt"
         self.auto_alerts_enabled = False
         
@@ -391,18 +2434,20 @@ class P2PNode:
                 self.evac_location = city_data["evac"]
                 break
         
-        with open(self.log_file, 'w') as f:
-            f.write(f"=== NATIONAL DISASTER ALERT SYSTEM ===\n")
-            f.write(f"Peer {port} - {self.area}\n")
-            f.write(f"Evacuation Location: {self.evac_location}\n")
-            f.write(f"{'='*50}\n\n")
+        header = (f"=== NATIONAL DISASTER ALERT SYSTEM ===\n"
+                  f"Peer {port} - {self.area}\n"
+                  f"Evacuation Location: {self.evac_location}\n"
+                  f"{'='*50}\n\n")
+        self.event_log = EventLogWriter(self.log_file, header, fsync=log_fsync)
+        self.log_order_lock = threading.Lock()
     
     def log_event(self, event: str):
         """Log events with Lamport timestamp"""
-        timestamp = self.clock.get()
-        log_entry = f"[LC:{timestamp}] {time.strftime('%H:%M:%S')} - {event}\n"
-        with open(self.log_file, 'a') as f:
-            f.write(log_entry)
+        # Read the clock and enqueue together so lines land in timestamp order
+        with self.log_order_lock:
+            timestamp = self.clock.get()
+            log_entry = f"[LC:{timestamp}] {time.strftime('%H:%M:%S')} - {event}\n"
+            self.event_log.write(log_entry)
     
     def should_receive_alert(self, msg: Message) -> bool:
         """Determine if this node should receive an alert"""
@@ -412,7 +2457,7 @@ class P2PNode:
         if not msg.target_areas:
             return True
         
-        return self.area in [a.upper() for a in msg.target_areas]
+        return any(area.upper() == self.area for area in msg.target_areas)
     
     def display_disaster_alert(self, msg: Message):
         """Display formatted disaster alert"""
@@ -443,30 +2488,119 @@ class P2PNode:
         
         self.log_event(f"DISASTER ALERT: {msg.disaster_type} - {msg.content}")
     
-    def listen_for_peers(self):
-        """Listen for incoming messages"""
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind(("0.0.0.0", self.port))
-        s.listen(5)
+    def listen_for_peers(self, s: Optional[socket.socket] = None):
+        """Listen for incoming messages (on s if given, already bound and listening)"""
+        if s is None:
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind(("0.0.0.0", self.port))
+            s.listen(5)
+        self.listener = s
+        self.pipeline.start()
         print(f"[PEER {self.port} - {self.area}] Listening for connections...")
 
         while True:
-            conn, addr = s.accept()
             try:
-                data = conn.recv(4096).decode()
-                if data:
-                    try:
-                        msg = Message.from_json(data)
-                        self.clock.update(msg.lamport_time)
-                        self.handle_message(msg)
-                    except json.JSONDecodeError:
-                        print(f"[PEER {self.port}] Invalid JSON from {addr}")
-            finally:
-                conn.close()
+                conn, addr = s.accept()
+            except OSError:
+                return  # Listener closed by shutdown()
+            threading.Thread(target=self.handle_connection, args=(conn, addr), daemon=True).start()
+    
+    def handle_connection(self, conn: socket.socket, addr):
+        """Decode back-to-back framed messages until the peer closes the connection"""
+        codec = "json"  # Until the peer's FRAME_HELLO says otherwise
+        try:
+            for kind, payload in FrameReader(conn):
+                if kind == FRAME_HELLO:
+                    codec = payload.decode()
+                    if codec not in CODECS:
+                        raise ValueError(f"unknown codec {codec}")
+                    continue
+                try:
+                    messages = decode_frame(kind, payload, codec)
+                except (ValueError, KeyError, IndexError, TypeError, struct.error):
+                    print(f"[PEER {self.port}] Invalid {codec} message from {addr}")
+                    continue
+                for msg in messages:
+                    self.failure_detector.heard(msg.sender_port)
+                    if msg.msg_type == MessageType.HEARTBEAT:
+                        continue  # Liveness only; not a Lamport event
+                    self.clock.update(msg.lamport_time)
+                    self.pipeline.submit(msg)
+        except ValueError as e:
+            print(f"[PEER {self.port}] Dropping connection from {addr}: {e}")
+        except OSError:
+            pass
+        finally:
+            conn.close()
+    
+    def start_async_runtime(self):
+        """Serve this node from an asyncio event loop instead of listen_for_peers"""
+        self.async_runtime = AsyncRuntime(self)
+        self.async_runtime.start()
+    
+    def start_heartbeats(self, interval: float = DEFAULT_HEARTBEAT_INTERVAL):
+        """Ping every peer each interval and suspect the silent ones"""
+        self.heartbeats_enabled = True
+        self.failure_detector.watch(port for _, port, _ in self.peers)
+        
+        def beat():
+            while self.heartbeats_enabled:
+                # Sent without ticking the Lamport clock; heartbeats are not events
+                msg = Message(msg_type=MessageType.HEARTBEAT, sender_port=self.port, lamport_time=self.clock.get())
+                try:
+                    self._note_failures(self._transmit(msg, list(self.current_peer_index().snapshot)))
+                except RuntimeError:
+                    return  # Send executor shut down on exit
+                self.failure_detector.check()
+                time.sleep(interval)
+        
+        threading.Thread(target=beat, name=f"heartbeat-{self.port}", daemon=True).start()
+    
+    def shutdown(self):
+        """Stop background sends, heartbeats and the listener; flush and close the log"""
+        self.auto_alerts_enabled = False
+        self.heartbeats_enabled = False
+        self.batcher.flush()
+        self.batcher.close()
+        self.event_log.close()
+        self.connection_pool.close_all()
+        self.send_executor.shutdown(wait=False)
+        self.pipeline.stop()
+        if self.async_runtime:
+            self.async_runtime.stop()
+        if self.listener:
+            try:
+                self.listener.shutdown(socket.SHUT_RDWR)  # Wakes the blocked accept()
+            except OSError:
+                pass
+            self.listener.close()
+    
+    def membership_changed(self, port: int, alive: bool):
+        """Let the mutexes re-evaluate pending requests when a peer is suspected or recovers"""
+        if self.lock_manager:
+            self.lock_manager.membership_changed(port, alive, self.send_message)
+        elif self.ricart_agrawala:
+            self.ricart_agrawala.membership_changed(port, alive, self.send_message)
+    
+    def receive_gossip(self, msg: Message) -> bool:
+        """Drop duplicate gossip and forward new gossip to a random fan-out; True if msg is new"""
+        if not self.gossip.record_receipt((msg.origin_port, msg.origin_time)):
+            return False
+        if msg.gossip_ttl > 0:
+            targets = self.gossip.pick_targets(self.route(msg), {msg.sender_port, msg.origin_port})
+            if targets:
+                forward = replace(msg, sender_port=self.port, gossip_ttl=msg.gossip_ttl - 1)
+                forward.lamport_time = self.clock.tick()
+                self.gossip.record_forward((msg.origin_port, msg.origin_time), len(targets))
+                self._transmit(forward, targets)
+        return True
     
     def handle_message(self, msg: Message):
         """Route messages to appropriate handlers"""
+        if msg.gossip_ttl is not None and not self.receive_gossip(msg):
+            return
+        
         if msg.msg_type in [MessageType.DISASTER, MessageType.NATIONAL]:
             if self.should_receive_alert(msg):
                 self.display_disaster_alert(msg)
@@ -481,13 +2615,10 @@ class P2PNode:
                 print(f"{'='*60}\n")
                 self.log_event(f"Custom alert: {msg.content}")
         
-        elif msg.msg_type == MessageType.REQUEST:
-            if self.ricart_agrawala:
-                self.ricart_agrawala.handle_request(msg, self.send_message)
-        
-        elif msg.msg_type == MessageType.REPLY:
-            if self.ricart_agrawala:
-                self.ricart_agrawala.handle_reply(msg)
+        elif msg.msg_type in MUTEX_MESSAGE_TYPES:
+            mutex = self.mutex_for(msg.resource)
+            if mutex:
+                mutex.handle(msg, self.send_message)
         
         elif msg.msg_type == MessageType.PREPARE:
             self.two_phase_commit.handle_prepare(msg, self.send_message)
@@ -498,24 +2629,178 @@ class P2PNode:
         elif msg.msg_type in [MessageType.COMMIT, MessageType.ABORT]:
             self.two_phase_commit.handle_decision(msg)
     
-    def send_message(self, msg: Message, specific_port: Optional[int] = None):
-        """Send message to peers"""
+    def _send_frame(self, host: str, port: int, frame: bytes) -> str:
+        """Deliver one frame through whichever runtime is active (used by the batcher)"""
+        if self.async_runtime:
+            return self.async_runtime.send(frame, [(host, port, "")])[port]
+        return self._deliver(host, port, frame)
+    
+    def _deliver(self, host: str, port: int, data: bytes) -> str:
+        try:
+            self.connection_pool.send(host, port, data)
+            return DELIVERED
+        except Exception:
+            return FAILED
+    
+    def send_message(self, msg: Message, specific_port: Optional[int] = None) -> Optional[Dict[int, str]]:
+        """Send message to peers, returning each peer's delivery result by port"""
         self.clock.tick()
         msg.lamport_time = self.clock.get()
         msg.sender_area = self.area
-        encoded_msg = msg.to_json().encode()
         
-        targets = [(h, p, a) for h, p, a in PEERS if p == specific_port] if specific_port else PEERS
+        if specific_port:
+            peer = self.current_peer_index().by_port.get(specific_port)
+            targets = [peer] if peer else []
+        else:
+            targets = self.route(msg)
         
-        for host, port, area in targets:
-            try:
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.settimeout(2)
-                s.connect((host, port))
-                s.sendall(encoded_msg)
-                s.close()
-            except Exception:
-                pass
+        if self.gossip.enabled and not specific_port and msg.msg_type in self.BATCHED_TYPES:
+            msg.origin_port = self.port
+            msg.origin_time = msg.lamport_time
+            msg.gossip_ttl = self.gossip.rounds
+            targets = self.gossip.pick_targets(targets, {self.port})
+            self.gossip.record_origin((msg.origin_port, msg.origin_time), len(targets))
+        
+        return self._note_failures(self._transmit(msg, targets))
+    
+    def _note_failures(self, results: Optional[Dict[int, str]]) -> Optional[Dict[int, str]]:
+        """Report peers we could not connect to to the failure detector"""
+        for port, result in (results or {}).items():
+            if result == FAILED:
+                self.failure_detector.report_failure(port)
+        return results
+    
+    def add_peer(self, host: str, port: int, area: str) -> bool:
+        """Add a peer unless its port is already known; False if it was"""
+        with self.lock:
+            if any(peer[1] == port for peer in self.peers):
+                return False
+            self.peers.append((host, port, area))
+            self.peers_version += 1
+            return True
+    
+    def current_peer_index(self) -> PeerIndex:
+        """Index over the peer list, rebuilt only when it has changed"""
+        index = self.peer_index
+        # The length check also catches code that appends to the list directly instead of add_peer
+        if index.version != self.peers_version or len(index.snapshot) != len(self.peers):
+            with self.lock:
+                index = self.peer_index
+                if index.version != self.peers_version or len(index.snapshot) != len(self.peers):
+                    index = self.peer_index = PeerIndex(self.peers, self.peers_version)
+        return index
+    
+    def route(self, msg: Message) -> List[Tuple[str, int, str]]:
+        """Peers that should get a broadcast: area-targeted alerts only go to peers in those areas"""
+        index = self.current_peer_index()
+        if msg.msg_type in (MessageType.ALERT, MessageType.DISASTER) and msg.target_areas:
+            targets = index.for_areas(msg.target_areas)
+            with self.lock:
+                self.peers_skipped += len(index.snapshot) - len(targets)
+            return targets
+        return list(index.snapshot)
+    
+    def _transmit(self, msg: Message, targets: List[Tuple[str, int, str]]) -> Optional[Dict[int, str]]:
+        """Encode an already-stamped message once and deliver it to each target"""
+        payload = encode_message(msg, self.codec)
+        
+        if self.batcher.window > 0 and msg.msg_type in self.BATCHED_TYPES:
+            futures = {self.batcher.enqueue(host, port, payload): port for host, port, _ in targets}
+            if self.async_runtime and self.async_runtime.in_loop():
+                return None  # Waiting here would stall the loop the batch is sent from
+            # The batch goes out for every message in it, so a late one is not cancelled
+            return self._collect(futures, self.batcher.window + self.broadcast_deadline, cancel_late=False)
+        
+        encoded_msg = encode_frame(payload)
+        if self.async_runtime:
+            return self.async_runtime.send(encoded_msg, targets)
+        
+        if len(targets) == 1:
+            host, port, _ = targets[0]
+            return {port: self._deliver(host, port, encoded_msg)}
+        
+        futures = {self.send_executor.submit(self._deliver, host, port, encoded_msg): port
+                   for host, port, _ in targets}
+        return self._collect(futures, self.broadcast_deadline)
+    
+    @staticmethod
+    def _collect(futures: Dict[Future, int], timeout: float, cancel_late: bool = True) -> Dict[int, str]:
+        """Per-port results of delivery futures; those not done by the deadline count as timed out"""
+        done, late = wait(futures, timeout=timeout)
+        if cancel_late:
+            for future in late:
+                future.cancel()  # Sends still queued behind slow peers are dropped; running ones finish
+        results = {port: TIMED_OUT for port in futures.values()}
+        for future in done:
+            results[futures[future]] = future.result()
+        return results
+    
+    @staticmethod
+    def delivery_summary(results: Optional[Dict[int, str]]) -> str:
+        """Describe partial delivery, e.g. '2/3 peers (not delivered: 6003 (failed))'"""
+        if results is None:
+            return "queued"
+        delivered = sum(1 for status in results.values() if status == DELIVERED)
+        summary = f"{delivered}/{len(results)} peers"
+        missed = [f"{port} ({status})" for port, status in results.items() if status != DELIVERED]
+        if missed:
+            summary += f" (not delivered: {', '.join(missed)})"
+        return summary
+    
+    def set_codec(self, codec: str):
+        """Switch wire codec; open connections are closed so the next send announces it"""
+        if codec not in CODECS:
+            print(f"[ERROR] Unknown codec: {codec}. Use {' or '.join(CODECS)}")
+            return
+        self.codec = codec
+        self.connection_pool.hello = encode_frame(codec.encode(), FRAME_HELLO)
+        self.connection_pool.close_all()
+        if self.async_runtime:
+            self.async_runtime.close_writers()
+        print(f"[CODEC] Using {codec} encoding for new connections")
+    
+    def show_gossip_stats(self):
+        stats = self.gossip.stats()
+        mode = f"gossip (fanout={self.gossip.fanout}, rounds={self.gossip.rounds})" if self.gossip.enabled else "direct"
+        print(f"\n[GOSSIP] Broadcast mode: {mode}")
+        print(f"[GOSSIP] originated={stats['originated']}  delivered={stats['delivered']}  "
+              f"duplicates={stats['duplicates']} ({stats['duplicate_rate']:.0%})  forwarded={stats['forwarded']}")
+        print(f"[GOSSIP] Measured here over the last {stats['tracked_messages']} messages: "
+              f"{stats['received_per_message']:.2f} copies received, {stats['sent_per_message']:.2f} sent per message")
+        if stats['deliveries_by_origin']:
+            delivered = ", ".join(f"{port}: {count}" for port, count in sorted(stats['deliveries_by_origin'].items()))
+            print(f"[GOSSIP] Delivered by origin: {delivered}")
+        if self.peers:
+            sim = simulate_gossip(len(self.peers) + 1, self.gossip.fanout, self.gossip.rounds)
+            print(f"[GOSSIP] Expected (simulated) for {len(self.peers) + 1} nodes: coverage {sim['coverage']:.0%}, "
+                  f"{sim['messages_per_broadcast']:.1f} msgs/broadcast vs {sim['direct_messages_per_broadcast']} direct")
+    
+    def show_pipeline_stats(self):
+        print(f"\n[PIPELINE] Receive queues on peer {self.port}:")
+        for name, q in self.pipeline.stats().items():
+            handler, wait_time = q['handler'], q['wait']
+            print(f"  - {name:<6} workers={q['workers']}  depth={q['depth']} (max {q['max_depth']})  "
+                  f"handled={handler['count']}  handler p50={handler['p50'] * 1000:.1f}ms "
+                  f"p99={handler['p99'] * 1000:.1f}ms  queue wait p99={wait_time['p99'] * 1000:.1f}ms")
+    
+    def show_connection_stats(self):
+        """Print per-peer connection reuse"""
+        batch = self.batcher.stats()
+        print(f"\n[BATCH] {batch['messages']} alerts in {batch['batches']} frames "
+              f"(avg {batch['avg_batch_size']:.1f}/frame, {batch['queued']} queued)")
+        print(f"[ROUTING] {self.peers_skipped} sends skipped by area routing")
+        suspects = sorted(self.failure_detector.suspects)
+        print(f"[FD] Suspected peers: {', '.join(map(str, suspects)) if suspects else 'none'}")
+        log = self.event_log.stats()
+        print(f"[LOG] {log['written']} lines in {log['batches']} writes "
+              f"(avg {log['avg_batch_size']:.1f}/write, {log['queued']} queued, {log['rotations']} rotations)")
+        stats = self.connection_pool.stats()
+        if not stats:
+            print("[POOL] No outbound connections yet")
+            return
+        print(f"[POOL] Outbound connections from peer {self.port}:")
+        for (host, port), s in stats.items():
+            print(f"  - {host}:{port}  connects={s['connects']}  sends={s['sends']}  reuse={s['reuse_ratio']:.0%}")
     
     def send_disaster_alert(self, disaster_type: str, custom_message: str = "", target_areas: Optional[List[str]] = None, severity: Optional[str] = None):
         """Send structured disaster alert"""
@@ -545,13 +2830,15 @@ class P2PNode:
             tips=disaster_info["tips"]
         )
         
-        self.send_message(msg)
+        results = self.send_message(msg)
         
         if is_national:
             print(f"[SENT] *** NATIONAL EMERGENCY ALERT BROADCAST TO ALL AREAS ***")
         else:
             areas_str = ", ".join(target_areas) if target_areas else "ALL AREAS"
             print(f"[SENT] {disaster_type} ({severity}) alert to: {areas_str}")
+        print(f"[SENT] Delivered to {self.delivery_summary(results)}")
+        return results
     
     def auto_disaster_simulator(self):
         """Simulate random disasters automatically"""
@@ -585,7 +2872,7 @@ class P2PNode:
             
             self.send_disaster_alert(disaster, random.choice(messages), target_areas)
     
-    def broadcast_custom_alert(self, message: str, target_areas: Optional[List[str]] = None):
+    def broadcast_custom_alert(self, message: str, target_areas: Optional[List[str]] = None) -> Optional[Dict[int, str]]:
         """Broadcast custom text alert"""
         msg = Message(
             msg_type=MessageType.ALERT,
@@ -595,27 +2882,96 @@ class P2PNode:
             target_areas=target_areas,
             sender_area=self.area
         )
-        self.send_message(msg)
+        return self.send_message(msg)
     
-    def demo_mutual_exclusion(self):
-        """Demo: Access critical section"""
-        if not self.ricart_agrawala:
-            print("[ERROR] Ricart-Agrawala not initialized!")
+    def mutex_for(self, resource: Optional[str]) -> Optional[DistributedMutex]:
+        """Mutex instance guarding a resource (None = global critical section)"""
+        if self.lock_manager:
+            return self.lock_manager.get(resource)
+        return None if resource else (self.maekawa or self.suzuki_kasami or self.ricart_agrawala)
+    
+    def demo_mutual_exclusion(self, resource: Optional[str] = None, mode: str = LOCK_EXCLUSIVE):
+        """Demo: Access critical section (LOCK_SHARED = read the signal state alongside other readers)"""
+        mutex = self.mutex_for(resource)
+        if not mutex:
+            print("[ERROR] Mutual exclusion not initialized!")
             return
         
         print(f"\n{'='*60}")
         print(f"TRAFFIC SIGNAL COORDINATION DEMO")
-        print(f"Peer {self.port} ({self.area}) coordinating signals")
+        print(f"Peer {self.port} ({self.area}) coordinating signals" + (f" for {resource}" if resource else ""))
         print(f"{'='*60}")
         
-        self.ricart_agrawala.request_critical_section(self.send_message)
+        if self.async_runtime:
+            self.async_runtime.run(self.demo_mutual_exclusion_async(mutex, mode))
+            return
         
-        self.log_event("CRITICAL SECTION: Adjusting traffic signals")
-        print(f"[CRITICAL SECTION] Peer {self.port} coordinating...")
-        time.sleep(2)
-        self.log_event("CRITICAL SECTION: Complete")
+        try:
+            with mutex.critical_section(self.send_message, DEFAULT_MUTEX_TIMEOUT, mode):
+                self.report_synchronization_delay(mutex)
+                self.log_event(self.critical_section_activity(mode))
+                print(f"[CRITICAL SECTION] Peer {self.port} coordinating...")
+                time.sleep(self.critical_section_work(mutex))
+                self.log_event("CRITICAL SECTION: Complete")
+        except TimeoutError as e:
+            print(f"[ERROR] {e}")
+            self.log_event("CRITICAL SECTION: Timed out waiting for peers")
+    
+    async def demo_mutual_exclusion_async(self, mutex: DistributedMutex, mode: str = LOCK_EXCLUSIVE):
+        """Demo: Access critical section without blocking the event loop"""
+        if not await mutex.request_critical_section_async(self.send_message, DEFAULT_MUTEX_TIMEOUT, mode):
+            print(f"[ERROR] {mutex.name} not granted within {DEFAULT_MUTEX_TIMEOUT}s")
+            self.log_event("CRITICAL SECTION: Timed out waiting for peers")
+            return
         
-        self.ricart_agrawala.release_critical_section(self.send_message)
+        try:
+            self.report_synchronization_delay(mutex)
+            self.log_event(self.critical_section_activity(mode))
+            print(f"[CRITICAL SECTION] Peer {self.port} coordinating...")
+            await asyncio.sleep(self.critical_section_work(mutex))
+            self.log_event("CRITICAL SECTION: Complete")
+        finally:
+            # Released even if the work fails or is cancelled, or peers would wait for us forever
+            mutex.release_critical_section(self.send_message)
+    
+    @staticmethod
+    def critical_section_work(mutex: DistributedMutex, work: float = 2.0) -> float:
+        """Seconds to spend in the critical section, cut short so we leave before our lease expires"""
+        remaining = mutex.lease_remaining()
+        if remaining < work:
+            print(f"[MUTEX] Only {max(remaining, 0):.1f}s of lease left; finishing early")
+        return max(min(work, remaining), 0.0)
+    
+    @staticmethod
+    def critical_section_activity(mode: str) -> str:
+        if mode == LOCK_SHARED:
+            return "CRITICAL SECTION: Reading traffic signal state"
+        return "CRITICAL SECTION: Adjusting traffic signals"
+    
+    def report_synchronization_delay(self, ra: DistributedMutex):
+        wait_time = ra.wait_times.snapshot()
+        print(f"[MUTEX] Synchronization delay {ra.last_wait * 1000:.1f}ms "
+              f"(p50 {wait_time['p50'] * 1000:.1f}ms, p99 {wait_time['p99'] * 1000:.1f}ms over {wait_time['count']} acquisitions)")
+        self.log_event(f"CRITICAL SECTION: Granted after {ra.last_wait * 1000:.1f}ms")
+    
+    def show_mutex_stats(self):
+        if self.lock_manager:
+            locks = self.lock_manager.stats()
+        elif self.mutex_for(None):
+            locks = {None: self.mutex_for(None).stats()}
+        else:
+            return
+        for resource, stats in locks.items():
+            self._show_lock_stats(resource, stats)
+    
+    def _show_lock_stats(self, resource: Optional[str], stats: dict):
+        wait_time, hold = stats['wait'], stats['hold']
+        print(f"\n[MUTEX] {resource or 'global'}: {stats['acquisitions']} acquisitions ({stats['shared']} shared), {stats['timeouts']} timeouts")
+        print(f"  - wait  p50={wait_time['p50'] * 1000:.1f}ms p99={wait_time['p99'] * 1000:.1f}ms max={wait_time['max'] * 1000:.1f}ms")
+        print(f"  - hold  p50={hold['p50'] * 1000:.1f}ms p99={hold['p99'] * 1000:.1f}ms max={hold['max'] * 1000:.1f}ms")
+        print(f"  - messages/acquisition {stats['messages_per_acquisition']}")
+        if 'has_token' in stats:
+            print(f"  - token {'held here' if stats['has_token'] else 'elsewhere'} (generation {stats['token_generation']})")
     
     def demo_two_phase_commit(self, transaction_data: str):
         """Demo: Coordinate atomic transaction"""
@@ -626,9 +2982,14 @@ class P2PNode:
         print(f"Peer {self.port} ({self.area}) coordinating: {transaction_data}")
         print(f"{'='*60}")
         
-        success = self.two_phase_commit.start_transaction_as_coordinator(
-            tx_id, transaction_data, self.send_message
-        )
+        if self.async_runtime:
+            success = self.async_runtime.run(self.two_phase_commit.start_transaction_as_coordinator_async(
+                tx_id, transaction_data, self.send_message
+            ))
+        else:
+            success = self.two_phase_commit.start_transaction_as_coordinator(
+                tx_id, transaction_data, self.send_message
+            )
         
         result = "SUCCESS" if success else "FAILED"
         self.log_event(f"Transaction {tx_id}: {result}")
@@ -733,7 +3094,7 @@ def main():
                         
                         if city_num in CITIES:
                             peer_area = CITIES[city_num]["name"]
-                            PEERS.append(("localhost", p, peer_area))
+                            node.add_peer("localhost", p, peer_area)
                             print(f"Added: localhost:{p} ({peer_area})")
                     except:
                         pass  # Port not active, skip
@@ -758,7 +3119,7 @@ def main():
                     host, p, city_num = parts
                     if city_num in CITIES:
                         peer_area = CITIES[city_num]["name"]
-                        PEERS.append((host, int(p), peer_area))
+                        node.add_peer(host, int(p), peer_area)
                     else:
                         print(f"Invalid city number. Use 1-5.")
                 else:
@@ -771,10 +3132,27 @@ def main():
         print(f"  - {host}:{p} ({a})")
     
     if PEERS:
-        node.ricart_agrawala = RicartAgrawala(port, node.clock, len(PEERS))
+        algorithm = input("\nMutual exclusion (1 = Ricart-Agrawala, 2 = Maekawa quorum, 3 = token) [1]: ").strip()
+        members = [port] + [p for _, p, _ in PEERS]
+        if algorithm == "2":
+            node.lock_manager = LockManager(port, node.clock, len(PEERS), members, "maekawa")
+            node.maekawa = node.lock_manager.get()
+            print(f"[MUTEX] Maekawa quorum: {node.maekawa.quorum}")
+        elif algorithm == "3":
+            node.lock_manager = LockManager(port, node.clock, len(PEERS), members, "token")
+            node.suzuki_kasami = node.lock_manager.get()
+            print(f"[MUTEX] Token starts at peer {node.suzuki_kasami.members[0]}")
+        else:
+            node.lock_manager = LockManager(port, node.clock, len(PEERS), members)
+            node.ricart_agrawala = node.lock_manager.get()
 
-    threading.Thread(target=node.listen_for_peers, daemon=True).start()
+    runtime = input("\nRuntime (1 = threaded, 2 = asyncio) [1]: ").strip()
+    if runtime == "2":
+        node.start_async_runtime()
+    else:
+        threading.Thread(target=node.listen_for_peers, daemon=True).start()
     time.sleep(1)
+    node.start_heartbeats()
 
     print(f"\n{'='*60}")
     print(f"{area} Emergency Center Online")
@@ -787,7 +3165,14 @@ def main():
     print("  msg <text>                    - Custom alert (your area)")
     print("  msg <city1,city2> <text>      - Custom alert (specific cities)")
     print("  mutex                         - Demo mutual exclusion")
+    print("  mutex <resource>              - Demo a named lock (e.g. HOUSTON)")
+    print("  mutex read [resource]         - Shared (read) lock; readers run in parallel")
     print("  2pc <data>                    - Demo two-phase commit")
+    print("  stats                         - Show peer connection stats")
+    print("  codec <binary|json>           - Choose wire encoding")
+    print("  batch <ms>                    - Alert coalescing window (0 = off)")
+    print("  gossip on|off|stats           - Gossip broadcast mode")
+    print("  gossip <fanout> <rounds>      - Tune gossip")
     print("  exit                          - Exit system")
     print(f"{'='*60}")
     print("\nEXAMPLES:")
@@ -801,7 +3186,7 @@ def main():
         cmd = input(f"[{area}]> ").strip()
         
         if cmd.lower() == "exit":
-            node.auto_alerts_enabled = False
+            node.shutdown()
             break
         
         elif cmd == "disaster":
@@ -909,12 +3294,18 @@ def main():
                 message_text = args
                 target_areas = [area]
 
-            node.broadcast_custom_alert(message_text, target_areas)
+            results = node.broadcast_custom_alert(message_text, target_areas)
             print(f"[SENT] Custom alert to {', '.join(target_areas) if target_areas else 'ALL AREAS'}")
+            print(f"[SENT] Delivered to {node.delivery_summary(results)}")
 
         
-        elif cmd.lower() == "mutex":
-            node.demo_mutual_exclusion()
+        elif cmd.lower().startswith("mutex"):
+            parts = cmd.split(maxsplit=2)[1:]
+            mode = LOCK_EXCLUSIVE
+            if parts and parts[0].lower() == "read":
+                mode = LOCK_SHARED
+                parts = parts[1:]
+            node.demo_mutual_exclusion(" ".join(parts).strip().upper() or None, mode)
         
         elif cmd.lower().startswith("2pc"):
             parts = cmd.split(maxsplit=1)
@@ -924,8 +3315,44 @@ def main():
             tx_data = parts[1]
             node.demo_two_phase_commit(tx_data)
         
+        elif cmd.lower() == "stats":
+            node.show_connection_stats()
+            node.show_pipeline_stats()
+            node.show_mutex_stats()
+        
+        elif cmd.lower().startswith("codec"):
+            parts = cmd.split()
+            if len(parts) < 2:
+                print(f"Usage: codec <binary|json>  (current: {node.codec})")
+                continue
+            node.set_codec(parts[1].lower())
+        
+        elif cmd.lower().startswith("batch"):
+            parts = cmd.split()
+            try:
+                window_ms = float(parts[1])
+            except (IndexError, ValueError):
+                print(f"Usage: batch <ms>  (current: {node.batcher.window * 1000:.0f} ms)")
+                continue
+            node.batcher.flush()
+            node.batcher.window = max(window_ms, 0) / 1000
+            print(f"[BATCH] Alert coalescing window set to {window_ms:.0f} ms")
+        
+        elif cmd.lower().startswith("gossip"):
+            parts = cmd.lower().split()
+            if len(parts) == 2 and parts[1] in ("on", "off"):
+                node.gossip.enabled = parts[1] == "on"
+                print(f"[GOSSIP] Broadcast mode: {'gossip' if node.gossip.enabled else 'direct'}")
+            elif len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+                node.gossip.fanout, node.gossip.rounds = int(parts[1]), int(parts[2])
+                print(f"[GOSSIP] fanout={node.gossip.fanout}, rounds={node.gossip.rounds}")
+            elif len(parts) == 2 and parts[1] == "stats":
+                node.show_gossip_stats()
+            else:
+                print("Usage: gossip on | gossip off | gossip stats | gossip <fanout> <rounds>")
+        
         else:
-            print("Unknown command. Type 'disaster', 'national', 'auto', 'msg', 'mutex', '2pc', or 'exit'.")
+            print("Unknown command. Type 'disaster', 'national', 'auto', 'msg', 'mutex', '2pc', 'stats', 'codec', 'batch', 'gossip', or 'exit'.")
 
 
 if __name__ == "__main__":
@@ -2,6 +2,8 @@ import socket
 import threading
 import json
 import time
+import select
+import struct
 from enum import Enum
 from dataclasses import dataclass, asdict
 from typing import Dict, List, Tuple, Optional, Set
@@ -46,6 +48,52 @@ class MessageType(Enum):
     ACK = "ack"                   # 2PC: Acknowledgment
 
 
+# Wire framing: 1-byte frame kind + 4-byte big-endian payload length
+FRAME_HEADER = struct.Struct("!BI")
+FRAME_MESSAGE = 1
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+def encode_frame(payload: bytes, kind: int = FRAME_MESSAGE) -> bytes:
+    """Prefix a payload with its frame header"""
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {len(payload)} bytes exceeds {MAX_FRAME_SIZE}")
+    return FRAME_HEADER.pack(kind, len(payload)) + payload
+
+
+class FrameReader:
+    """Split a socket byte stream into (kind, payload) frames"""
+    
+    def __init__(self, sock: socket.socket, chunk_size: int = 65536):
+        self.sock = sock
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+    
+    def feed(self, data: bytes) -> List[Tuple[int, bytes]]:
+        """Buffer raw bytes and return every frame completed by them"""
+        self.buffer.extend(data)
+        frames = []
+        offset = 0
+        while len(self.buffer) - offset >= FRAME_HEADER.size:
+            kind, length = FRAME_HEADER.unpack_from(self.buffer, offset)
+            if length > MAX_FRAME_SIZE:
+                raise ValueError(f"Incoming frame of {length} bytes exceeds {MAX_FRAME_SIZE}")
+            end = offset + FRAME_HEADER.size + length
+            if end > len(self.buffer):
+                break
+            frames.append((kind, bytes(self.buffer[offset + FRAME_HEADER.size:end])))
+            offset = end
+        del self.buffer[:offset]
+        return frames
+    
+    def __iter__(self):
+        while True:
+            data = self.sock.recv(self.chunk_size)
+            if not data:
+                return
+            yield from self.feed(data)
+
+
 @dataclass
 class Message:
     msg_type: MessageType
@@ -68,6 +116,95 @@ class Message:
         return Message(**msg_dict)
 
 
+class ConnectionPool:
+    """Long-lived outbound connections, one per (host, port)"""
+    
+    def __init__(self, timeout: float = 2):
+        self.timeout = timeout
+        self.connections: Dict[Tuple[str, int], socket.socket] = {}
+        self.peer_locks: Dict[Tuple[str, int], threading.Lock] = {}
+        self.connect_counts: Dict[Tuple[str, int], int] = {}
+        self.send_counts: Dict[Tuple[str, int], int] = {}
+        self.lock = threading.Lock()
+    
+    def _peer_lock(self, addr: Tuple[str, int]) -> threading.Lock:
+        with self.lock:
+            if addr not in self.peer_locks:
+                self.peer_locks[addr] = threading.Lock()
+                self.connect_counts[addr] = 0
+                self.send_counts[addr] = 0
+            return self.peer_locks[addr]
+    
+    def _connect(self, addr: Tuple[str, int]) -> socket.socket:
+        s = socket.create_connection(addr, timeout=self.timeout)
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connections[addr] = s
+        self.connect_counts[addr] += 1
+        return s
+    
+    def _drop(self, addr: Tuple[str, int]):
+        s = self.connections.pop(addr, None)
+        if s:
+            try:
+                s.close()
+            except OSError:
+                pass
+    
+    @staticmethod
+    def _is_stale(s: socket.socket) -> bool:
+        """Peers never write back on these connections, so readable means closed"""
+        try:
+            readable, _, _ = select.select([s], [], [], 0)
+            return bool(readable) and s.recv(1, socket.MSG_PEEK) == b""
+        except OSError:
+            return True
+    
+    def send(self, host: str, port: int, data: bytes):
+        """Send on the pooled connection, reconnecting once if it went bad"""
+        addr = (host, port)
+        with self._peer_lock(addr):
+            s = self.connections.get(addr)
+            if s and self._is_stale(s):
+                self._drop(addr)
+                s = None
+            if s:
+                try:
+                    s.sendall(data)
+                    self.send_counts[addr] += 1
+                    return
+                except OSError:
+                    self._drop(addr)
+            
+            s = self._connect(addr)
+            try:
+                s.sendall(data)
+            except OSError:
+                self._drop(addr)
+                raise
+            self.send_counts[addr] += 1
+    
+    def stats(self) -> Dict[Tuple[str, int], dict]:
+        """Per-peer connect count, send count and reuse ratio"""
+        with self.lock:
+            result = {}
+            for addr, sends in self.send_counts.items():
+                connects = self.connect_counts[addr]
+                reuse = (sends - connects) / sends if sends else 0.0
+                result[addr] = {
+                    'connects': connects,
+                    'sends': sends,
+                    'reuse_ratio': max(reuse, 0.0)
+                }
+            return result
+    
+    def close_all(self):
+        with self.lock:
+            addrs = list(self.connections)
+        for addr in addrs:
+            with self._peer_lock(addr):
+                self._drop(addr)
+
+
 class RicartAgrawala:
     """Distributed Mutual Exclusion using Ricart-Agrawala algorithm"""
     
@@ -295,6 +432,7 @@ class P2PNode:
         self.clock = LamportClock()
         self.ricart_agrawala: Optional[RicartAgrawala] = None
         self.two_phase_commit = TwoPhaseCommit(port, self.clock)
+        self.connection_pool = ConnectionPool()  # One long-lived socket per peer
         self.log_file = f"peer_{port}_{area}_log.txt"
         
         # Clear log file
@@ -328,17 +466,27 @@ class P2PNode:
 
         while True:
             conn, addr = s.accept()
-            try:
-                data = conn.recv(4096).decode()
-                if data:
-                    try:
-                        msg = Message.from_json(data)
-                        self.clock.update(msg.lamport_time)
-                        self.handle_message(msg)
-                    except json.JSONDecodeError:
-                        print(f"[PEER {self.port}] Invalid JSON from {addr}")
-            finally:
-                conn.close()
+            # Each peer keeps its connection open, so read it on its own thread
+            threading.Thread(target=self.handle_connection, args=(conn, addr), daemon=True).start()
+    
+    def handle_connection(self, conn: socket.socket, addr):
+        """Decode back-to-back framed messages until the peer closes the connection"""
+        try:
+            for kind, payload in FrameReader(conn):
+                if kind != FRAME_MESSAGE:
+                    continue
+                try:
+                    msg = Message.from_json(payload.decode())
+                    self.clock.update(msg.lamport_time)
+                    self.handle_message(msg)
+                except json.JSONDecodeError:
+                    print(f"[PEER {self.port}] Invalid JSON from {addr}")
+        except ValueError as e:
+            print(f"[PEER {self.port}] Dropping connection from {addr}: {e}")
+        except OSError:
+            pass
+        finally:
+            conn.close()
     
     def handle_message(self, msg: Message):
         """Route messages to appropriate handlers"""
@@ -378,20 +526,26 @@ class P2PNode:
         self.clock.tick()
         msg.lamport_time = self.clock.get()
         msg.sender_area = self.area  # Always include sender's area
-        encoded_msg = msg.to_json().encode()
+        encoded_msg = encode_frame(msg.to_json().encode())  # Length header marks the end of each message
         
         targets = [(h, p, a) for h, p, a in PEERS if p == specific_port] if specific_port else PEERS
         
         for host, port, area in targets:
             try:
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.settimeout(2)
-                s.connect((host, port))
-                s.sendall(encoded_msg)
-                s.close()
+                self.connection_pool.send(host, port, encoded_msg)
             except Exception as e:
                 print(f"[PEER {self.port}] !!! Could not reach {host}:{port}")
     
+    def show_connection_stats(self):
+        """Print per-peer connection reuse"""
+        stats = self.connection_pool.stats()
+        if not stats:
+            print("[POOL] No outbound connections yet")
+            return
+        print(f"\n[POOL] Outbound connections from peer {self.port}:")
+        for (host, port), s in stats.items():
+            print(f"  - {host}:{port}  connects={s['connects']}  sends={s['sends']}  reuse={s['reuse_ratio']:.0%}")
+    
     def broadcast_alert(self, message: str, target_areas: Optional[List[str]] = None):
         """Broadcast alert to specific areas or all areas"""
         if target_areas:
@@ -501,6 +655,7 @@ def main():
     print("  msg <area1,area2> <text>      - Broadcast alert to specific areas")
     print("  mutex                         - Demo distributed mutual exclusion")
     print("  2pc <data>                    - Demo two-phase commit transaction")
+    print("  stats                         - Show peer connection stats")
     print("  exit                          - Exit program")
     print(f"{'='*60}")
     print("\nExamples:")
@@ -514,6 +669,7 @@ def main():
         cmd = input(f"[{port}-{area}]> ").strip()
         
         if cmd.lower() == "exit":
+            node.connection_pool.close_all()
             break
         elif cmd.startswith("msg "):
             rest = cmd[4:].strip()
@@ -543,8 +699,10 @@ def main():
                 args=(transaction_data,),
                 daemon=True
             ).start()
+        elif cmd == "stats":
+            node.show_connection_stats()
         else:
-            print("Unknown command. Use: msg, mutex, 2pc, or exit")
+            print("Unknown command. Use: msg, mutex, 2pc, stats, or exit")
 
 
 if __name__ == "__main__":
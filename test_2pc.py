@@ -4,13 +4,23 @@ import socket
 import json
 import threading
 import random
+import tempfile
+import os
 from typing import List, Tuple
 
+def free_port() -> int:
+    """Ask the OS for a localhost port nothing is listening on"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
 class TestParticipant:
     """Enhanced participant for testing with fault injection"""
     
-    def __init__(self, port: int):
-        self.port = port
+    def __init__(self, port: int = 0, extra_args: Tuple[str, ...] = ()):
+        self.port = port or free_port()  # 0 picks a free port, so parallel or repeated runs don't collide
+        self.extra_args = list(extra_args)
         self.process = None
         self.should_fail = False
         self.fail_on_commit = False
@@ -19,7 +29,7 @@ class TestParticipant:
     def start(self):
         """Start the participant server"""
         self.process = subprocess.Popen(
-            ['python', 'tm_participant.py', '--port', str(self.port)],
+            ['python', 'tm_participant.py', '--port', str(self.port)] + self.extra_args,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE
         )
@@ -41,17 +51,15 @@ class TwoPhaseCommitTester:
     
     def __init__(self):
         self.participants = []
-        self.base_port = 7000
         
     def setup_participants(self, num_participants: int) -> List[Tuple[str, int]]:
-        """Start multiple participant nodes"""
+        """Start multiple participant nodes on free ports"""
         nodes = []
         for i in range(num_participants):
-            port = self.base_port + i
-            participant = TestParticipant(port)
+            participant = TestParticipant()
             participant.start()
             self.participants.append(participant)
-            nodes.append(("127.0.0.1", port))
+            nodes.append(("127.0.0.1", participant.port))
         return nodes
         
     def teardown(self):
@@ -60,6 +68,17 @@ class TwoPhaseCommitTester:
             p.stop()
         self.participants = []
         
+    @staticmethod
+    def send(node: Tuple[str, int], msg: dict) -> dict:
+        """Send one message to a participant and return its reply"""
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.settimeout(2)
+        s.connect(node)
+        s.sendall(json.dumps(msg).encode())
+        resp = json.loads(s.recv(4096).decode())
+        s.close()
+        return resp
+        
     def simulate_network_partition(self, node_index: int):
         """Simulate network partition by killing a specific node"""
         if node_index < len(self.participants):
@@ -240,7 +259,8 @@ def test_node_failure_during_commit():
 def test_simultaneous_writes():
     """
     Test behavior when two transactions try to write to the same key simultaneously.
-    Expected: One should succeed, one should abort due to lock conflict.
+    Expected: The second waits in the key's lock queue until the first commits, then
+    commits itself, so both succeed one after the other (no lost update, no abort).
     """
     print("\n" + "------------")
     print("TEST 3: SIMULTANEOUS CONFLICTING WRITES")
@@ -327,10 +347,10 @@ def test_simultaneous_writes():
         
         print(f"\nCommits: {commits}, Aborts: {aborts}")
         
-        if commits == 1 and aborts == 1:
-            print("[PASS] Exactly one transaction committed (proper lock handling)")
-        elif commits == 2:
-            print("[FAIL] Both transactions committed (lost update)")
+        if commits == 2:
+            print("[PASS] Both transactions committed, serialized by the lock queue")
+        elif commits == 1 and aborts == 1:
+            print("[FAIL] One transaction aborted instead of waiting for the lock")
         else:
             print("[FAIL] Both transactions aborted (potential deadlock)")
             
@@ -344,7 +364,8 @@ def test_simultaneous_writes():
 def test_cascading_conflicts():
     """
     Test with multiple transactions writing to overlapping key sets.
-    Expected: Proper serialization through locks.
+    Expected: Proper serialization through locks; each transaction waits for the
+    one holding its overlapping key, so all three commit in order.
     """
     print("\n" + "------------")
     print("TEST 4: CASCADING WRITE CONFLICTS (3 TRANSACTIONS)")
@@ -389,7 +410,377 @@ def test_cascading_conflicts():
         
         commits = sum(1 for r in results if r['decision'] == 'COMMIT')
         print(f"\nTotal commits: {commits}/3")
-        print("[INFO] At least one should abort due to conflicts")
+        print("[INFO] Conflicting transactions wait for the lock instead of aborting; expect 3/3")
+        
+    finally:
+        tester.teardown()
+
+
+ 
+# TEST CASE 5: Write-Ahead Log Recovery and Group Commit
+ 
+def test_wal_recovery():
+    """
+    Test that a participant started with --wal survives a crash.
+    Expected: committed writes are back after restart, a prepared-but-undecided
+    transaction is still in doubt and keeps its locks until the decision arrives,
+    and concurrent prepares/commits share fsyncs.
+    """
+    print("\n" + "------------")
+    print("TEST 5: WAL RECOVERY AND GROUP COMMIT")
+    print("------------")
+    
+    wal_dir = tempfile.TemporaryDirectory()
+    wal_path = os.path.join(wal_dir.name, "participant.wal")
+    participant = TestParticipant(extra_args=("--wal", wal_path))
+    node = ("127.0.0.1", participant.port)
+    participant.start()
+    send = TwoPhaseCommitTester.send
+    
+    try:
+        # One committed transaction, one left in doubt
+        send(node, {"type": "PREPARE", "txid": "wal-tx-1", "writes": {"shelter": "open"}})
+        send(node, {"type": "COMMIT", "txid": "wal-tx-1"})
+        vote = send(node, {"type": "PREPARE", "txid": "wal-tx-2", "writes": {"route_9": "closed"}})
+        print(f"[SETUP] wal-tx-1 committed, wal-tx-2 prepared ({vote['type']}) with no decision")
+        
+        # Concurrent transactions on distinct keys share fsyncs
+        def write(i):
+            txid = f"wal-batch-{i}"
+            send(node, {"type": "PREPARE", "txid": txid, "writes": {f"sensor_{i}": "ok"}})
+            send(node, {"type": "COMMIT", "txid": txid})
+        
+        threads = [threading.Thread(target=write, args=(i,)) for i in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        wal_stats = send(node, {"type": "STATS"})["wal"]
+        print(f"[GROUP COMMIT] {wal_stats['records']} records in {wal_stats['fsyncs']} fsyncs "
+              f"(max batch {wal_stats['max_batch']}), commit p50 {wal_stats['commit_ms']['p50']:.2f} ms")
+        
+        print("\n[FAULT INJECTION] Killing participant and restarting from its WAL...")
+        participant.stop()
+        participant.start()
+        
+        stats = send(node, {"type": "STATS"})
+        print(f"[RECOVERY] keys={stats['keys']} in_doubt={stats['in_doubt']}")
+        
+        blocked = send(node, {"type": "PREPARE", "txid": "wal-tx-3", "writes": {"route_9": "open"}})
+        print(f"[RECOVERY] New write to in-doubt key -> {blocked['type']}")
+        
+        send(node, {"type": "COMMIT", "txid": "wal-tx-2"})
+        after = send(node, {"type": "STATS"})
+        print(f"[RECOVERY] After deciding wal-tx-2: keys={after['keys']} in_doubt={after['in_doubt']}")
+        
+        recovered = (stats['keys'] == 21 and stats['in_doubt'] == ["wal-tx-2"]
+                     and blocked['type'] == "VOTE_ABORT" and after['keys'] == 22 and not after['in_doubt'])
+        if recovered:
+            print("[PASS] Committed data and in-doubt transaction recovered from the WAL")
+        else:
+            print("[FAIL] State after restart does not match the log")
+        assert recovered
+        
+    finally:
+        participant.stop()
+        wal_dir.cleanup()
+
+
+ 
+# TEST CASE 6: Parallel Coordinator With Early Abort
+ 
+def test_parallel_coordinator():
+    """
+    Test tm_coordinator.two_phase_commit, which prepares and decides on all
+    participants in parallel.
+    Expected: a healthy cluster commits; with one node down the transaction aborts
+    without waiting on the others, and the survivors' locks are released so a later
+    transaction on the same key commits.
+    """
+    from tm_coordinator import two_phase_commit
+    
+    print("\n" + "------------")
+    print("TEST 6: PARALLEL COORDINATOR WITH EARLY ABORT")
+    print("------------")
+    
+    tester = TwoPhaseCommitTester()
+    nodes = tester.setup_participants(3)
+    
+    try:
+        time.sleep(1)
+        
+        started = time.perf_counter()
+        healthy = two_phase_commit(nodes, {"siren": "on"})
+        print(f"[HEALTHY] committed={healthy} in {(time.perf_counter() - started) * 1000:.1f} ms")
+        
+        tester.simulate_network_partition(1)
+        started = time.perf_counter()
+        partitioned = two_phase_commit(nodes, {"siren": "off"})
+        print(f"[PARTITION] committed={partitioned} in {(time.perf_counter() - started) * 1000:.1f} ms")
+        
+        time.sleep(0.5)  # Let queued aborts reach nodes whose prepare was still in flight
+        survivors = [nodes[0], nodes[2]]
+        retried = two_phase_commit(survivors, {"siren": "off"})
+        print(f"[SURVIVORS] committed={retried}")
+        
+        ok = healthy and not partitioned and retried
+        if ok:
+            print("[PASS] Commit, early abort and lock release all behaved as expected")
+        else:
+            print("[FAIL] Unexpected parallel 2PC outcome")
+        assert ok
+        
+    finally:
+        tester.teardown()
+
+
+ 
+# TEST CASE 7: Key-Sharded Participants
+ 
+def test_sharded_commit():
+    """
+    Test sharded mode: keys are routed to participants by consistent hashing.
+    Expected: every key is stored on exactly one participant, load is spread over
+    all of them, and a single-key transaction only prepares on the key's owner.
+    """
+    from tm_coordinator import HashRing, two_phase_commit
+    
+    print("\n" + "------------")
+    print("TEST 7: KEY-SHARDED PARTICIPANTS")
+    print("------------")
+    
+    tester = TwoPhaseCommitTester()
+    nodes = tester.setup_participants(3)
+    ring = HashRing(nodes)
+    
+    try:
+        time.sleep(1)
+        
+        writes = {f"zone_{i}": "evacuated" for i in range(30)}
+        committed = two_phase_commit(nodes, writes, ring=ring)
+        
+        single = two_phase_commit(nodes, {"zone_single": "clear"}, ring=ring)
+        
+        counts = {node: TwoPhaseCommitTester.send(node, {"type": "STATS"})["keys"] for node in nodes}
+        for node, keys in counts.items():
+            print(f"[SHARD] {node[0]}:{node[1]} stores {keys} keys")
+        
+        expected = {node: sum(1 for k in list(writes) + ["zone_single"] if ring.owner(k) == node) for node in nodes}
+        ok = committed and single and counts == expected and all(counts.values())
+        if ok:
+            print(f"[PASS] {sum(counts.values())} keys stored once each across {len(nodes)} shards")
+        else:
+            print(f"[FAIL] Shard contents {counts} do not match ring ownership {expected}")
+        assert ok
+        
+    finally:
+        tester.teardown()
+
+
+ 
+# TEST CASE 8: Batched Transactions
+ 
+def test_batched_transactions():
+    """
+    Test PREPARE_BATCH / DECISION_BATCH frames carrying many transactions.
+    Expected: each transaction gets its own vote and decision, so only the ones that
+    conflict (with each other or with a transaction already holding a lock) abort.
+    """
+    from tm_coordinator import two_phase_commit_batch
+    
+    print("\n" + "------------")
+    print("TEST 8: BATCHED TRANSACTIONS")
+    print("------------")
+    
+    tester = TwoPhaseCommitTester()
+    nodes = tester.setup_participants(2)
+    send = TwoPhaseCommitTester.send
+    
+    try:
+        time.sleep(1)
+        
+        # An in-flight transaction holds "bridge" on every node
+        for node in nodes:
+            send(node, {"type": "PREPARE", "txid": "holder", "writes": {"bridge": "closed"}})
+        
+        batch = [{f"report_{i}": "received"} for i in range(50)]
+        batch.append({"bridge": "open"})               # conflicts with the holder
+        batch.append({"report_0": "duplicate"})        # conflicts with the first transaction in the batch
+        
+        started = time.perf_counter()
+        committed = two_phase_commit_batch(nodes, batch)
+        print(f"[BATCH] {sum(committed)}/{len(batch)} committed in {(time.perf_counter() - started) * 1000:.1f} ms")
+        
+        stats = [send(node, {"type": "STATS"}) for node in nodes]
+        ok = (committed == [True] * 50 + [False, False]
+              and all(st["keys"] == 50 and st["in_doubt"] == ["holder"] for st in stats))
+        if ok:
+            print("[PASS] Per-transaction votes: 50 committed, both conflicting transactions aborted")
+        else:
+            print(f"[FAIL] Unexpected batch outcome {committed} / {stats}")
+        assert ok
+        
+    finally:
+        tester.teardown()
+
+
+ 
+# TEST CASE 9: Lock Queue and Deadlock Prevention
+ 
+def test_lock_queue():
+    """
+    Test the participant lock manager's wait queue and timestamp rule.
+    Expected: a newer transaction waits behind the holder and gets the lock when the
+    holder aborts; an older transaction that would wait behind a newer one aborts
+    immediately (so waits can never form a cycle).
+    """
+    print("\n" + "------------")
+    print("TEST 9: LOCK QUEUE AND DEADLOCK PREVENTION")
+    print("------------")
+    
+    tester = TwoPhaseCommitTester()
+    node = tester.setup_participants(1)[0]
+    send = TwoPhaseCommitTester.send
+    
+    try:
+        time.sleep(1)
+        
+        send(node, {"type": "PREPARE", "txid": "holder", "writes": {"dam": "open"}, "ts": 200})
+        
+        started = time.perf_counter()
+        older = send(node, {"type": "PREPARE", "txid": "older", "writes": {"dam": "closed"}, "ts": 100})
+        older_ms = (time.perf_counter() - started) * 1000
+        print(f"[OLDER] {older['type']} after {older_ms:.1f} ms")
+        
+        newer = {}
+        waiter = threading.Thread(target=lambda: newer.update(
+            send(node, {"type": "PREPARE", "txid": "newer", "writes": {"dam": "closed"}, "ts": 300})))
+        waiter.start()
+        time.sleep(0.3)
+        was_waiting = waiter.is_alive()
+        print(f"[NEWER] waiting while holder has the lock: {was_waiting}")
+        
+        send(node, {"type": "ABORT", "txid": "holder"})
+        waiter.join()
+        print(f"[NEWER] {newer['type']} after the holder aborted")
+        
+        locks = send(node, {"type": "STATS"})["locks"]
+        print(f"[LOCKS] {locks}")
+        
+        ok = (older["type"] == "VOTE_ABORT" and older_ms < 500 and was_waiting
+              and newer["type"] == "VOTE_COMMIT" and locks["deaths"] == 1 and locks["waits"] == 1)
+        if ok:
+            print("[PASS] Newer transaction queued for the lock; older one aborted instead of waiting")
+        else:
+            print("[FAIL] Lock queue did not follow timestamp order")
+        assert ok
+        
+    finally:
+        tester.teardown()
+
+
+ 
+# TEST CASE 10: MVCC Snapshot Reads
+ 
+def test_snapshot_reads():
+    """
+    Test GET / MGET / SCAN while a transaction is prepared but undecided.
+    Expected: reads return at once with the last committed values (never the staged
+    ones), all keys in one MGET/SCAN come from the same snapshot, the new values appear
+    after COMMIT, and old versions are garbage-collected when nobody is reading them.
+    """
+    print("\n" + "------------")
+    print("TEST 10: MVCC SNAPSHOT READS")
+    print("------------")
+    
+    tester = TwoPhaseCommitTester()
+    node = tester.setup_participants(1)[0]
+    send = TwoPhaseCommitTester.send
+    
+    try:
+        time.sleep(1)
+        
+        send(node, {"type": "PREPARE", "txid": "read-1", "writes": {"level_north": "low", "level_south": "low"}})
+        send(node, {"type": "COMMIT", "txid": "read-1"})
+        
+        # In flight: holds both locks, values staged but not committed
+        send(node, {"type": "PREPARE", "txid": "read-2", "writes": {"level_north": "high", "level_south": "high"}})
+        
+        started = time.perf_counter()
+        single = send(node, {"type": "GET", "key": "level_north"})
+        multi = send(node, {"type": "MGET", "keys": ["level_north", "level_south", "level_east"]})
+        scan = send(node, {"type": "SCAN", "prefix": "level_"})
+        read_ms = (time.perf_counter() - started) * 1000
+        print(f"[READ] during prepare: GET={single['value']} MGET={multi['values']} SCAN={scan['values']} "
+              f"({read_ms:.1f} ms for 3 reads)")
+        
+        send(node, {"type": "COMMIT", "txid": "read-2"})
+        after = send(node, {"type": "MGET", "keys": ["level_north", "level_south"]})
+        print(f"[READ] after commit: {after['values']} at snapshot {after['ts']}")
+        
+        for i in range(20):
+            send(node, {"type": "PREPARE", "txid": f"read-gc-{i}", "writes": {"level_north": str(i)}})
+            send(node, {"type": "COMMIT", "txid": f"read-gc-{i}"})
+        mvcc = send(node, {"type": "STATS"})["mvcc"]
+        print(f"[GC] {mvcc}")
+        
+        low = {"level_north": "low", "level_south": "low"}
+        ok = (single["value"] == "low" and multi["values"] == low and scan["values"] == low
+              and multi["ts"] == scan["ts"] == single["ts"] and read_ms < 500
+              and after["values"] == {"level_north": "high", "level_south": "high"}
+              and mvcc["versions"] == 2 and mvcc["collected"] == 22)
+        if ok:
+            print("[PASS] Snapshot reads ignored the prepared writes and old versions were collected")
+        else:
+            print("[FAIL] Snapshot reads saw uncommitted data, blocked, or leaked versions")
+        assert ok
+        
+    finally:
+        tester.teardown()
+
+
+ 
+# TEST CASE 11: Multiplexed Coordinator Sessions
+ 
+def test_multiplexed_sessions():
+    """
+    Test many concurrent transactions from one coordinator process.
+    Expected: every transaction commits, each participant sees a single session
+    connection carrying all of them, and one-shot JSON requests (used by this
+    harness) are still answered on the same port.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from tm_coordinator import two_phase_commit
+    
+    print("\n" + "------------")
+    print("TEST 11: MULTIPLEXED COORDINATOR SESSIONS")
+    print("------------")
+    
+    tester = TwoPhaseCommitTester()
+    nodes = tester.setup_participants(3)
+    
+    try:
+        time.sleep(1)
+        
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(lambda i: two_phase_commit(nodes, {f"shelter_{i}": "open"}), range(40)))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"[CONCURRENT] {sum(results)}/40 committed in {elapsed_ms:.1f} ms")
+        
+        stats = [TwoPhaseCommitTester.send(node, {"type": "STATS"}) for node in nodes]
+        for node, st in zip(nodes, stats):
+            print(f"[CONNECTIONS] {node[0]}:{node[1]} -> {st['connections']}")
+        
+        ok = (all(results)
+              and all(st["connections"]["sessions"] == 1 for st in stats)
+              and all(st["connections"]["legacy"] >= 1 for st in stats))
+        if ok:
+            print("[PASS] All transactions shared one session per participant")
+        else:
+            print("[FAIL] Transactions aborted or opened extra connections")
+        assert ok
         
     finally:
         tester.teardown()
@@ -407,7 +798,14 @@ if __name__ == "__main__":
         ("Network Partition During Prepare", test_network_partition_during_prepare),
         ("Node Failure During Commit", test_node_failure_during_commit),
         ("Simultaneous Conflicting Writes", test_simultaneous_writes),
-        ("Cascading Write Conflicts", test_cascading_conflicts)
+        ("Cascading Write Conflicts", test_cascading_conflicts),
+        ("WAL Recovery and Group Commit", test_wal_recovery),
+        ("Parallel Coordinator With Early Abort", test_parallel_coordinator),
+        ("Key-Sharded Participants", test_sharded_commit),
+        ("Batched Transactions", test_batched_transactions),
+        ("Lock Queue and Deadlock Prevention", test_lock_queue),
+        ("MVCC Snapshot Reads", test_snapshot_reads),
+        ("Multiplexed Coordinator Sessions", test_multiplexed_sessions)
     ]
     
     passed = 0
@@ -0,0 +1,145 @@
+import threading
+import time
+from typing import Dict, Optional, Set
+
+from disaster import DistributedMutex, LamportClock, Message, RicartAgrawala, SuzukiKasamiMutex
+
+
+class LocalNetwork:
+    """In-process transport for mutex instances, with fault injection"""
+
+    def __init__(self):
+        self.mutexes: Dict[int, DistributedMutex] = {}
+        self.down: Set[int] = set()
+
+    def add(self, mutex: DistributedMutex) -> DistributedMutex:
+        self.mutexes[mutex.node_port] = mutex
+        return mutex
+
+    def sender(self, port: int):
+        """send_func for the mutex on port, delivering each message on its own thread"""
+        def send(msg: Message, specific_port: Optional[int] = None):
+            if port in self.down:
+                return
+            targets = [specific_port] if specific_port is not None else [p for p in self.mutexes if p != port]
+            for target in targets:
+                if target not in self.down:
+                    threading.Thread(target=self.mutexes[target].handle,
+                                     args=(msg, self.sender(target)), daemon=True).start()
+        return send
+
+    def suspect(self, port: int):
+        """Have every other mutex's failure detector suspect port"""
+        for other, mutex in self.mutexes.items():
+            if other != port and other not in self.down:
+                mutex.membership_changed(port, False, self.sender(other))
+
+    def kill(self, port: int):
+        """Crash the node on port: it stops sending and receiving, and is suspected"""
+        self.down.add(port)
+        self.suspect(port)
+
+
+
+# TEST CASE 1: Ricart-Agrawala With a Suspected Holder
+
+def test_suspected_holder_keeps_lease():
+    """
+    Suspect the node in the critical section while it is actually still alive.
+    Expected: a second requester does not enter until the permission it gave the
+    holder has expired, even though the holder dropped out of its quorum.
+    """
+    print("\n" + "------------")
+    print("TEST 1: RICART-AGRAWALA WITH A SUSPECTED HOLDER")
+    print("------------")
+
+    net = LocalNetwork()
+    peers = [9101, 9102]
+    holder = net.add(RicartAgrawala(9101, LamportClock(), 1, peers=peers, lease_duration=2.0))
+    waiter = net.add(RicartAgrawala(9102, LamportClock(), 1, peers=peers, lease_duration=2.0))
+
+    assert holder.request_critical_section(net.sender(9101), timeout=5)
+    try:
+        net.suspect(9101)
+        started = time.monotonic()
+        lease_left = waiter.granted_to[9101] - started
+
+        entered = waiter.request_critical_section(net.sender(9102), timeout=5)
+        waited = time.monotonic() - started
+        print(f"[WAIT] Waiter entered={entered} after {waited:.2f}s (holder's lease had {lease_left:.2f}s left)")
+
+        ok = entered and waited >= lease_left
+        if ok:
+            print("[PASS] Suspected holder kept the lock until its lease expired")
+        else:
+            print("[FAIL] Waiter entered while the suspected holder's lease was live")
+        assert ok
+
+    finally:
+        holder.release_critical_section(net.sender(9101))
+        if waiter.in_critical_section:
+            waiter.release_critical_section(net.sender(9102))
+
+
+
+# TEST CASE 2: Token Regeneration After the Holder Crashes
+
+def test_token_regenerated_without_holder():
+    """
+    Crash the token holder inside the critical section, then request the lock elsewhere.
+    Expected: the requester stops waiting for the suspected holder's TOKEN_STATUS,
+    regenerates the token with a higher generation from the surviving peers, and enters.
+    """
+    print("\n" + "------------")
+    print("TEST 2: TOKEN REGENERATION AFTER THE HOLDER CRASHES")
+    print("------------")
+
+    net = LocalNetwork()
+    members = [9301, 9302, 9303]
+    holder, waiter, _ = [net.add(SuzukiKasamiMutex(port, LamportClock(), members)) for port in members]
+    waiter.stall_interval = 1.0  # Query for the token sooner than DEFAULT_TOKEN_TIMEOUT
+
+    assert holder.request_critical_section(net.sender(9301), timeout=5)
+    old_generation = waiter.generation
+    net.kill(9301)
+
+    entered = waiter.request_critical_section(net.sender(9302), timeout=5)
+    try:
+        print(f"[TOKEN] Waiter entered={entered} with generation {waiter.generation} (was {old_generation})")
+
+        ok = entered and waiter.has_token and waiter.generation > old_generation
+        if ok:
+            print("[PASS] Token regenerated without the crashed holder")
+        else:
+            print("[FAIL] Regeneration still waited on the crashed holder")
+        assert ok
+
+    finally:
+        if waiter.in_critical_section:
+            waiter.release_critical_section(net.sender(9302))
+
+
+
+# RUN ALL TESTS
+
+if __name__ == "__main__":
+    print("\n" + "------------")
+    print("TESTING")
+    print("------------")
+
+    tests = [
+        ("Ricart-Agrawala With a Suspected Holder", test_suspected_holder_keeps_lease),
+        ("Token Regeneration After the Holder Crashes", test_token_regenerated_without_holder)
+    ]
+
+    for name, test_func in tests:
+        try:
+            test_func()
+        except Exception as e:
+            print(f"\n[ERROR] Test '{name}' failed with exception: {e}")
+            import traceback
+            traceback.print_exc()
+
+    print("\n""------------")
+    print("TEST COMPLETE")
+    print("------------")
@@ -1,20 +1,157 @@
-
 import socket
 import json
 import uuid
 import argparse
+import time
+import bisect
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+from tm_participant import recv_frame, send_frame
+
+# Shared by every transaction so both phases reach all participants at once
+executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="2pc")
+
+class Session:
+    """A persistent framed connection to one participant, shared by concurrent calls.
+
+    Every request carries an id that the participant echoes back, and a reader thread
+    resolves the Future returned for that id, so many PREPARE/COMMIT calls can be
+    outstanding at once without a thread blocked on each, and none of them pays for a
+    connect. If the connection drops, every outstanding call fails and the next call
+    opens a new session.
+    """
+
+    def __init__(self, addr, timeout=2):
+        self.sock = socket.create_connection(addr, timeout=timeout)
+        self.sock.settimeout(timeout)  # bounds sendall if the participant stops reading
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.lock = threading.Lock()        # guards pending, next_id and closed
+        self.write_lock = threading.Lock()  # keeps frames from interleaving
+        self.pending = {}
+        self.next_id = 0
+        self.closed = False
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def submit(self, data):
+        """Send data now; the returned Future gets the reply"""
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise ConnectionError("session closed")
+            self.next_id += 1
+            rid = self.next_id
+            self.pending[rid] = future
+        try:
+            with self.write_lock:
+                send_frame(self.sock, dict(data, id=rid))
+        except OSError:
+            self.close()  # fails this future along with the rest
+        return future
+
+    def call(self, data, timeout=2):
+        return self.submit(data).result(timeout)
+
+    def _read_loop(self):
+        try:
+            while True:
+                msg = recv_frame(self.sock)
+                if msg is None:
+                    break
+                with self.lock:
+                    future = self.pending.pop(msg.get("id"), None)
+                if future and not future.done():
+                    future.set_result(msg)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("session closed"))
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+# One live session per participant address
+sessions = {}
+sessions_lock = threading.Lock()
+
+def session_for(addr, timeout=2):
+    with sessions_lock:
+        session = sessions.get(addr)
+        if session and not session.closed:
+            return session
+    # Connect outside the lock so an unreachable participant doesn't stall calls to the others
+    session = Session(addr, timeout)
+    with sessions_lock:
+        current = sessions.get(addr)
+        if current and not current.closed:
+            session.close()
+            return current
+        sessions[addr] = session
+        return session
 
 def send_msg(addr, data, timeout=2):
-    h, pt = addr
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.settimeout(timeout)
-    s.connect((h, pt))
-    s.sendall(json.dumps(data).encode())
-    resp = json.loads(s.recv(4096).decode())
-    s.close()
-    return resp
-
-def two_phase_commit(nodes, writes):
+    return session_for(tuple(addr), timeout).call(data, timeout)
+
+def call_async(addr, data, timeout=2):
+    """Future for the reply to data. Over a live session no thread waits on it, so calls
+    stuck in a participant's lock queue can't starve the COMMITs that would free them."""
+    with sessions_lock:
+        session = sessions.get(addr)
+    if session and not session.closed:
+        try:
+            return session.submit(data)
+        except ConnectionError:
+            pass  # closed just now; reconnect below
+    return executor.submit(send_msg, addr, data, timeout)
+
+def ring_hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:4], "big")
+
+class HashRing:
+    """Consistent hashing of keys onto participants.
+
+    Each participant is placed at `vnodes` points on a 32-bit ring and owns the keys
+    that hash between its points and the previous ones, so load spreads evenly and
+    adding or removing a participant only moves about 1/N of the keys.
+    """
+
+    def __init__(self, nodes, vnodes=64):
+        self.points = sorted((ring_hash(f"{h}:{pt}#{i}"), (h, pt)) for h, pt in nodes for i in range(vnodes))
+        self.hashes = [point for point, _ in self.points]
+
+    def owner(self, key):
+        i = bisect.bisect(self.hashes, ring_hash(key)) % len(self.points)
+        return self.points[i][1]
+
+    def partition(self, writes):
+        """Split a write set into {participant: the writes it owns}"""
+        shards = {}
+        for k, v in writes.items():
+            shards.setdefault(self.owner(k), {})[k] = v
+        return shards
+
+def send_after(future, addr, data):
+    """Send data to addr once future (that node's outstanding PREPARE) has finished"""
+    def send(_):
+        try:
+            call_async(addr, data)
+        except RuntimeError:
+            pass  # interpreter shutting down
+    future.add_done_callback(send)
+
+def two_phase_commit(nodes, writes, timeout=2, ring=None):
+    """Run one transaction; with a HashRing, each participant only gets (and locks) the keys it owns"""
     txid = str(uuid.uuid4())
 
     print("\n==== New Transaction ====")
@@ -22,48 +159,127 @@ def two_phase_commit(nodes, writes):
     print("writes =", writes)
     print()
 
+    if ring:
+        # Participants that own none of the keys take no part in the transaction
+        shards = ring.partition(writes)
+        for n, part in shards.items():
+            print(f"shard {n[0]}:{n[1]} <- {sorted(part)}")
+        print()
+    else:
+        shards = {n: writes for n in nodes}
+
     print("-- Prepare Phase --")
-    votes = []
-    for n in nodes:
-        try:
-            prep = {"type": "PREPARE", "txid": txid, "writes": writes}
-            reply = send_msg(n, prep)
-            if reply.get("type") == "VOTE_COMMIT":
+    started = time.perf_counter()
+    ts = time.time()  # orders this transaction against others waiting for the same locks
+    pending = {call_async(n, {"type": "PREPARE", "txid": txid, "writes": part, "ts": ts}, timeout): n
+               for n, part in shards.items()}
+
+    # Votes arrive in completion order; the first abort or timeout decides the transaction
+    decision = "COMMIT"
+    try:
+        for future in as_completed(pending, timeout):
+            n = pending[future]
+            try:
+                vote = future.result().get("type")
+            except Exception:
+                vote = None
+            if vote == "VOTE_COMMIT":
                 print(f"{n[0]}:{n[1]} -> commit vote")
             else:
-                print(f"{n[0]}:{n[1]} -> abort vote")
-            votes.append(reply.get("type"))
-        except:
-            print(f"{n[0]}:{n[1]} -> no reply (timeout)")
-            votes.append("VOTE_ABORT")
-
-    if all(v == "VOTE_COMMIT" for v in votes):
-        decision = "COMMIT"
-    else:
+                print(f"{n[0]}:{n[1]} -> " + ("abort vote" if vote else "no reply (timeout)"))
+                decision = "ABORT"
+                break
+    except FuturesTimeout:
+        print("no reply (timeout) from " + ", ".join(f"{n[0]}:{n[1]}" for f, n in pending.items() if not f.done()))
         decision = "ABORT"
+    prepare_ms = (time.perf_counter() - started) * 1000
 
     print()
     print("-- Commit Phase --" if decision == "COMMIT" else "-- abort phase --")
 
-    for n in nodes:
+    started = time.perf_counter()
+    msg = {"type": decision, "txid": txid}
+    sends = {}
+    for future, n in pending.items():
+        if future.done():
+            sends[call_async(n, msg, timeout)] = n
+        else:
+            # Still preparing: an ABORT sent now could overtake the PREPARE and leave its locks behind
+            send_after(future, n, msg)
+            print(f"abort to {n[0]}:{n[1]} queued until its prepare returns")
+
+    wait(sends, timeout)
+    for future, n in sends.items():
         try:
-            resp = send_msg(n, {"type": decision, "txid": txid})
-            status = resp.get("msg", "ok")
+            status = future.result(0).get("msg", "ok")
             print(f"sent {decision.lower()} to {n[0]}:{n[1]} ({status})")
-        except:
+        except Exception:
             print(f"failed sending {decision.lower()} to {n[0]}:{n[1]}")
+    decide_ms = (time.perf_counter() - started) * 1000
 
     print()
-    print("Transaction Result:", decision)
+    print(f"Transaction Result: {decision} (prepare {prepare_ms:.1f} ms, {decision.lower()} {decide_ms:.1f} ms)")
     print()
 
     return decision == "COMMIT"
 
+def two_phase_commit_batch(nodes, transactions, timeout=2, ring=None):
+    """Run many transactions (a list of write sets) with one PREPARE_BATCH and one
+    DECISION_BATCH frame per participant. Each transaction keeps its own txid and is
+    decided on its own votes; returns one committed flag per transaction."""
+    txids = [str(uuid.uuid4()) for _ in transactions]
+
+    # Per participant: the (txid, writes) pairs it takes part in, in batch order
+    plan = {}
+    ts = time.time()
+    for txid, writes in zip(txids, transactions):
+        shards = ring.partition(writes) if ring else {n: writes for n in nodes}
+        for n, part in shards.items():
+            plan.setdefault(n, []).append({"txid": txid, "writes": part, "ts": ts})
+
+    started = time.perf_counter()
+    pending = {call_async(n, {"type": "PREPARE_BATCH", "txns": txns}, timeout): n
+               for n, txns in plan.items()}
+    wait(pending, timeout)
+
+    # A transaction commits only if every participant it touched voted commit; a participant
+    # that fails to answer aborts everything it was asked to prepare
+    commit = dict.fromkeys(txids, True)
+    for future, n in pending.items():
+        try:
+            votes = future.result(0)["votes"]
+        except Exception:
+            print(f"{n[0]}:{n[1]} -> no reply (timeout), aborting its {len(plan[n])} transactions")
+            votes = ["VOTE_ABORT"] * len(plan[n])
+        for tx, vote in zip(plan[n], votes):
+            if vote != "VOTE_COMMIT":
+                commit[tx["txid"]] = False
+    prepare_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    sends = {}
+    for n, txns in plan.items():
+        decisions = [{"txid": tx["txid"], "decision": "COMMIT" if commit[tx["txid"]] else "ABORT"} for tx in txns]
+        sends[call_async(n, {"type": "DECISION_BATCH", "decisions": decisions}, timeout)] = n
+    wait(sends, timeout)
+    for future, n in sends.items():
+        if not future.done() or future.exception():
+            print(f"failed sending decisions to {n[0]}:{n[1]}")
+    decide_ms = (time.perf_counter() - started) * 1000
+
+    committed = [commit[txid] for txid in txids]
+    print(f"Batch of {len(transactions)}: {sum(committed)} committed, {len(committed) - sum(committed)} aborted "
+          f"(prepare {prepare_ms:.1f} ms, decide {decide_ms:.1f} ms)")
+    return committed
+
 if __name__ == "__main__":
     p = argparse.ArgumentParser()
     p.add_argument("--participants", nargs="+", required=True)
     p.add_argument("--key", required=True)
     p.add_argument("--value", required=True)
+    p.add_argument("--sharded", action="store_true", help="send each key only to the participant that owns it")
+    p.add_argument("--repeat", type=int, default=1, help="run this many transactions, writing <key>_<i>")
+    p.add_argument("--batch", type=int, default=1, help="transactions per PREPARE/DECISION frame when repeating")
     args = p.parse_args()
 
     nodes = []
@@ -71,6 +287,18 @@ if __name__ == "__main__":
         h, pt = x.split(":")
         nodes.append((h, int(pt)))
 
-    committed = two_phase_commit(nodes, {args.key: args.value})
+    ring = HashRing(nodes) if args.sharded else None
+
+    if args.repeat > 1:
+        transactions = [{f"{args.key}_{i}": args.value} for i in range(args.repeat)]
+        started = time.perf_counter()
+        committed = 0
+        for i in range(0, len(transactions), args.batch):
+            committed += sum(two_phase_commit_batch(nodes, transactions[i:i + args.batch], ring=ring))
+        elapsed = time.perf_counter() - started
+        print(f"\nRESULT: {committed}/{args.repeat} committed in {elapsed:.2f} s "
+              f"({args.repeat / elapsed:.0f} tx/s, batch size {args.batch})")
+    else:
+        committed = two_phase_commit(nodes, {args.key: args.value}, ring=ring)
 
-    print("RESULT:", "COMMITTED" if committed else "ABORTED")
+        print("RESULT:", "COMMITTED" if committed else "ABORTED")
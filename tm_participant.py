@@ -1,82 +1,631 @@
-
 import socket
 import json
 import threading
 import argparse
+import os
+import struct
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_LOCK_WAIT = 1.0  # seconds; below the coordinator's 2 s reply timeout
+MAX_LOCK_WAIT = 1.5      # longer waits would outlast the coordinator, which then sends ABORT mid-wait
+MAX_FRAME = 64 * 1024 * 1024
+EARLY_RELEASES = 4096    # released-before-PREPARE txids remembered so a late PREPARE votes abort
 
 db = {}
-lock_table = {}
 staged_data = {}
 
-def handle_prepare(txid, writes):
-    for k in writes:
-        if k in lock_table and lock_table[k] != txid:
-            print(f"[{txid[:6]}] prepare -> abort (lock conflict)")
-            return {"type": "VOTE_ABORT"}
-    for k in writes:
-        lock_table[k] = txid
+# Guards db and staged_data between handle_client threads (not held while waiting on the log)
+table_lock = threading.Lock()
+
+wal = None  # WriteAheadLog when started with --wal; otherwise state is memory-only
+
+class WriteAheadLog:
+    """Append-only log of PREPARE/COMMIT/ABORT records (one JSON object per line).
+
+    Group commit: append() queues a record and waits until it is on disk. A single
+    flusher thread writes everything queued since its last fsync and fsyncs once,
+    so concurrent handle_client threads share the cost of each fsync.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "ab")
+        self.cond = threading.Condition()
+        self.pending = []
+        self.appended = 0  # records queued so far
+        self.durable = 0   # records written and fsynced so far
+
+        self.fsyncs = 0
+        self.max_batch = 0  # records per fsync
+        self.latencies = deque(maxlen=10000)  # seconds from append() to durable
+
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def append(self, record, sync=True):
+        """Queue a record; with sync, return only once it has been fsynced"""
+        self.append_many([record], sync)
+
+    def append_many(self, records, sync=True):
+        """Queue several records that become durable together"""
+        started = time.perf_counter()
+        with self.cond:
+            self.pending.extend((json.dumps(record) + "\n").encode() for record in records)
+            self.appended += len(records)
+            seq = self.appended
+            self.cond.notify_all()
+            if not sync:
+                return
+            while self.durable < seq:
+                self.cond.wait()
+            self.latencies.append(time.perf_counter() - started)
+
+    def _flush_loop(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                batch, self.pending = self.pending, []
+                seq = self.appended
+
+            # Records that arrive during the write/fsync form the next batch
+            self.file.write(b"".join(batch))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+            with self.cond:
+                self.durable = seq
+                self.fsyncs += 1
+                self.max_batch = max(self.max_batch, len(batch))
+                self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            latencies = sorted(self.latencies)
+            durable, fsyncs, max_batch = self.durable, self.fsyncs, self.max_batch
+
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000 if latencies else 0.0
+
+        return {
+            "records": durable,
+            "fsyncs": fsyncs,
+            "avg_batch": durable / fsyncs if fsyncs else 0.0,
+            "max_batch": max_batch,
+            "commit_ms": {"p50": pct(50), "p95": pct(95), "p99": pct(99)},
+        }
+
+class LockManager:
+    """Exclusive key locks with a FIFO wait queue per key.
+
+    A transaction locks all of its keys at PREPARE (in sorted order) or none of them.
+    Deadlocks are prevented by timestamp order: a transaction may only wait behind older
+    transactions (the holder and everyone already queued). One that would have to wait
+    behind a newer transaction aborts instead, so every wait points from newer to older and
+    no cycle can form, across participants too when coordinators stamp PREPARE with "ts".
+    Holders are never preempted, because a transaction that has voted commit cannot be
+    aborted by a participant. Waits are also bounded by max_wait, for example when a
+    coordinator never sends its decision. Releasing a transaction that is still waiting
+    (its ABORT overtook the PREPARE) takes it out of the queue and the waiter gives up;
+    releasing one that has not asked for locks yet makes its PREPARE fail when it does.
+    """
+
+    def __init__(self, max_wait=DEFAULT_LOCK_WAIT):
+        self.max_wait = max_wait
+        self.cond = threading.Condition()
+        self.owner = {}     # key -> txid holding it
+        self.queues = {}    # key -> deque of waiting txids
+        self.held = {}      # txid -> keys it holds, so release touches only those
+        self.waiting = {}   # txid -> key it is queued for
+        self.priority = {}  # txid -> (ts, txid); smaller is older; gone once released
+        self.early = OrderedDict()  # txids released before they asked for any lock, oldest first
+
+        self.waits = 0
+        self.deaths = 0
+        self.timeouts = 0
+        self.cancelled = 0
+
+    def acquire_all(self, txid, keys, ts=None, wait=True):
+        """Lock every key or none; returns False if the transaction must abort"""
+        deadline = time.monotonic() + self.max_wait
+        with self.cond:
+            if txid in self.early:
+                # Its ABORT got here first (the PREPARE sat in a session's queue)
+                del self.early[txid]
+                self.cancelled += 1
+                return False
+            me = self.priority.setdefault(txid, (time.time() if ts is None else ts, txid))
+            for k in sorted(keys):
+                if not self._acquire(txid, me, k, wait, deadline):
+                    self._release(txid)
+                    return False
+            return True
+
+    def _acquire(self, txid, me, k, wait, deadline):
+        owner = self.owner.get(k)
+        if owner is None or owner == txid:
+            self.owner[k] = txid
+            self.held.setdefault(txid, set()).add(k)
+            return True
+
+        queue = self.queues.setdefault(k, deque())
+        # A txid without a priority entry is treated as the oldest, so we wait (bounded) behind it
+        if not wait or any(self.priority.get(t, (0.0, t)) > me for t in [owner, *queue]):
+            if wait:
+                self.deaths += 1
+            if not queue:
+                del self.queues[k]
+            return False
+
+        queue.append(txid)
+        self.waiting[txid] = k
+        self.waits += 1
+        while self.owner.get(k) != txid:
+            if txid not in self.priority:
+                # Released while queued; _release already took us out of the queue
+                self.cancelled += 1
+                return False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._dequeue(txid)
+                self.timeouts += 1
+                return False
+            self.cond.wait(remaining)
+        self.waiting.pop(txid, None)
+        return True
+
+    def _dequeue(self, txid):
+        k = self.waiting.pop(txid, None)
+        queue = self.queues.get(k)
+        if queue and txid in queue:
+            queue.remove(txid)
+            if not queue:
+                del self.queues[k]
+
+    def release(self, txid):
+        with self.cond:
+            if txid not in self.priority:
+                self.early[txid] = None
+                if len(self.early) > EARLY_RELEASES:
+                    self.early.popitem(last=False)
+            self._release(txid)
+
+    def _release(self, txid):
+        """Leave any queue and hand each held key to the head of its queue (lock held)"""
+        self._dequeue(txid)
+        for k in self.held.pop(txid, ()):
+            queue = self.queues.get(k)
+            if queue:
+                head = queue.popleft()
+                self.owner[k] = head
+                self.held.setdefault(head, set()).add(k)
+                if not queue:
+                    del self.queues[k]
+            else:
+                del self.owner[k]
+        self.priority.pop(txid, None)
+        self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {"held": len(self.owner), "waiting": sum(len(q) for q in self.queues.values()),
+                    "waits": self.waits, "deaths": self.deaths, "timeouts": self.timeouts,
+                    "cancelled": self.cancelled}
+
+locks = LockManager()
+
+class VersionStore:
+    """Multi-version copy of committed data for lock-free snapshot reads.
+
+    Each commit appends (commit_ts, value) to every key it wrote and only then advances
+    `committed`, so a reader that picks snapshot = committed sees each transaction fully or
+    not at all. Readers never touch the lock manager, table_lock or staged (prepared) data,
+    so they neither wait for nor delay in-flight PREPAREs. Version lists are replaced, never
+    edited in place, so a reader can walk one while a commit trims it.
+
+    Garbage collection: the watermark is the oldest snapshot still being read (or the
+    latest commit if none). A key keeps its newest version at or below the watermark plus
+    everything newer. Older ones are dropped when the key is written, and keys left with
+    old versions are swept once there have been as many commits as such keys, so the
+    sweep costs O(1) per commit on average.
+    """
+
+    def __init__(self):
+        self.versions = {}   # key -> [(commit_ts, value), ...] oldest first
+        self.committed = 0   # newest fully installed commit_ts
+        self.readers = {}    # reader id -> snapshot ts
+        self.next_reader = 0
+        self.reader_lock = threading.Lock()  # only readers and GC use this, never PREPARE
+        self.stale = set()   # keys holding more than one version
+        self.since_sweep = 0
+        self.collected = 0
+
+    def load(self, data):
+        """Seed with recovered data as the initial version"""
+        self.versions = {k: [(0, v)] for k, v in data.items()}
+
+    def install(self, writes):
+        """Add one committed transaction's writes as a new version (call under table_lock)"""
+        ts = self.committed + 1
+        watermark = self.watermark()
+        for k, v in writes.items():
+            self.versions[k] = self._trim(self.versions.get(k, []), watermark) + [(ts, v)]
+            if len(self.versions[k]) > 1:
+                self.stale.add(k)
+        self.committed = ts
+
+        self.since_sweep += 1
+        if self.since_sweep >= len(self.stale):
+            self.since_sweep = 0
+            watermark = self.watermark()
+            for k in list(self.stale):
+                self.versions[k] = self._trim(self.versions[k], watermark)
+                if len(self.versions[k]) == 1:
+                    self.stale.discard(k)
+
+    def _trim(self, kept, watermark):
+        """Drop versions that no snapshot at or above the watermark can see"""
+        live = next((i for i in range(len(kept) - 1, -1, -1) if kept[i][0] <= watermark), 0)
+        self.collected += live
+        return kept[live:] if live else kept
+
+    def watermark(self):
+        with self.reader_lock:
+            return min(self.readers.values(), default=self.committed)
+
+    def begin(self):
+        """Start a read: returns (reader id, snapshot ts)"""
+        with self.reader_lock:
+            self.next_reader += 1
+            self.readers[self.next_reader] = self.committed
+            return self.next_reader, self.committed
+
+    def end(self, reader):
+        with self.reader_lock:
+            self.readers.pop(reader, None)
+
+    def read(self, key, ts):
+        for version_ts, value in reversed(self.versions.get(key, ())):
+            if version_ts <= ts:
+                return value
+        return None
+
+    def read_many(self, keys):
+        """Values of keys (missing ones omitted) at one snapshot"""
+        reader, ts = self.begin()
+        try:
+            values = {}
+            for k in keys:
+                v = self.read(k, ts)
+                if v is not None:
+                    values[k] = v
+            return ts, values
+        finally:
+            self.end(reader)
 
-    staged_data[txid] = writes
+    def scan(self, prefix="", limit=None):
+        """Keys starting with prefix, in key order, at one snapshot"""
+        keys = sorted(k for k in list(self.versions) if k.startswith(prefix))
+        ts, values = self.read_many(keys)
+        if limit is not None:
+            values = dict(list(values.items())[:limit])
+        return ts, values
+
+    def stats(self):
+        versions = list(self.versions.values())
+        return {"snapshot": self.committed, "watermark": self.watermark(),
+                "versions": sum(len(v) for v in versions), "collected": self.collected}
+
+store = VersionStore()
+
+def recover(path):
+    """Rebuild db and in-doubt (prepared, undecided) transactions from the log, then compact it"""
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break  # torn write at the tail from a crash mid-append
+                op, txid = rec["op"], rec.get("txid")
+                if op == "SNAPSHOT":
+                    db.update(rec["db"])
+                elif op == "PREPARE":
+                    staged_data[txid] = rec["writes"]
+                elif op == "COMMIT":
+                    db.update(staged_data.pop(txid, {}))
+                elif op == "ABORT":
+                    staged_data.pop(txid, None)
+
+    store.load(db)
+
+    # In-doubt transactions keep their locks until the coordinator's decision arrives
+    for txid, writes in staged_data.items():
+        locks.acquire_all(txid, writes, ts=0.0, wait=False)  # oldest: new transactions queue behind them
+        print(f"[{txid[:6]}] recovered in doubt (prepared, awaiting decision)")
+
+    # Rewrite the log as a snapshot plus the in-doubt prepares so it doesn't grow forever
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(json.dumps({"op": "SNAPSHOT", "db": db}) + "\n")
+        for txid, writes in staged_data.items():
+            f.write(json.dumps({"op": "PREPARE", "txid": txid, "writes": writes}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    print(f"recovered {len(db)} keys, {len(staged_data)} in-doubt transactions from {path}")
+
+def recv_json(conn):
+    """Read one JSON message, however many recv() calls it takes (batches exceed 4096 bytes)"""
+    data = b""
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            raise ConnectionError("connection closed mid-message")
+        data += chunk
+        try:
+            return json.loads(data.decode())
+        except ValueError:
+            continue  # incomplete; a truncated JSON object never parses
+
+def recv_exact(conn, n):
+    """Exactly n bytes from conn, or None if it closed before sending any"""
+    data = b""
+    while len(data) < n:
+        try:
+            chunk = conn.recv(n - len(data))
+        except socket.timeout:
+            continue  # idle session; the coordinator's timeout is there to bound its sends
+        if not chunk:
+            if data:
+                raise ConnectionError("connection closed mid-frame")
+            return None
+        data += chunk
+    return data
+
+def recv_frame(conn):
+    """One length-prefixed JSON message from a session; None once the peer closes"""
+    header = recv_exact(conn, 4)
+    if header is None:
+        return None
+    (length,) = struct.unpack("!I", header)
+    if length > MAX_FRAME:
+        raise ValueError(f"frame of {length} bytes is too large")
+    payload = recv_exact(conn, length)
+    if payload is None:
+        raise ConnectionError("connection closed mid-frame")
+    return json.loads(payload.decode())
+
+def send_frame(conn, msg):
+    payload = json.dumps(msg).encode()
+    conn.sendall(struct.pack("!I", len(payload)) + payload)
+
+def lock_and_stage(txid, writes, ts=None, wait=True):
+    """Take every write lock (waiting in line if allowed) or none; returns False to vote abort"""
+    if not locks.acquire_all(txid, writes, ts, wait):
+        return False
+    with table_lock:
+        staged_data[txid] = writes
+    return True
+
+def finish(txid, commit):
+    """Apply (commit) or drop (abort) a transaction's staged writes and release its locks"""
+    with table_lock:
+        if txid in staged_data:
+            if commit:
+                for k, v in staged_data[txid].items():
+                    db[k] = v
+                store.install(staged_data[txid])
+            del staged_data[txid]
+
+    locks.release(txid)
+
+def handle_prepare(txid, writes, ts=None):
+    if not lock_and_stage(txid, writes, ts):
+        print(f"[{txid[:6]}] prepare -> abort (lock conflict)")
+        return {"type": "VOTE_ABORT"}
+
+    # Must be durable before we promise to commit
+    if wal:
+        wal.append({"op": "PREPARE", "txid": txid, "writes": writes})
     print(f"[{txid[:6]}] prepare -> vote commit")
     return {"type": "VOTE_COMMIT"}
 
 def handle_commit(txid):
-    if txid in staged_data:
-        for k, v in staged_data[txid].items():
-            db[k] = v
-        del staged_data[txid]
+    if wal and txid in staged_data:
+        wal.append({"op": "COMMIT", "txid": txid})
 
-    for k in list(lock_table):
-        if lock_table[k] == txid:
-            del lock_table[k]
+    finish(txid, commit=True)
 
     print(f"[{txid[:6]}] commit applied")
     return {"type": "ACK", "msg": "committed"}
 
 def handle_abort(txid):
-    if txid in staged_data:
-        del staged_data[txid]
+    # Presumed abort: a lost ABORT record just leaves the txid in doubt, so don't wait for it
+    if wal and txid in staged_data:
+        wal.append({"op": "ABORT", "txid": txid}, sync=False)
 
-    for k in list(lock_table):
-        if lock_table[k] == txid:
-            del lock_table[k]
+    finish(txid, commit=False)
 
     print(f"[{txid[:6]}] aborted")
     return {"type": "ACK", "msg": "aborted"}
 
-def handle_client(conn, addr):
-    try:
-        msg = json.loads(conn.recv(4096).decode())
-        t = msg.get("type")
-        txid = msg.get("txid")
-
-        if t == "PREPARE":
-            resp = handle_prepare(txid, msg["writes"])
-        elif t == "COMMIT":
-            resp = handle_commit(txid)
-        elif t == "ABORT":
-            resp = handle_abort(txid)
+def handle_prepare_batch(txns):
+    """PREPARE many transactions in one frame; the reply's vote vector follows txns' order.
+
+    Batched transactions don't wait for locks: the decision for the whole batch only comes
+    after this reply, so waiting (even on a transaction earlier in the same batch) would
+    stall every transaction in it.
+    """
+    votes = []
+    prepared = []
+    for tx in txns:
+        if lock_and_stage(tx["txid"], tx["writes"], tx.get("ts"), wait=False):
+            votes.append("VOTE_COMMIT")
+            prepared.append({"op": "PREPARE", "txid": tx["txid"], "writes": tx["writes"]})
         else:
-            resp = {"type": "ERROR", "msg": "unknown"}
+            votes.append("VOTE_ABORT")
+
+    # One fsync covers the whole batch
+    if wal and prepared:
+        wal.append_many(prepared)
+    print(f"[batch] prepare {len(txns)} -> {len(prepared)} commit votes")
+    return {"type": "VOTES", "votes": votes}
+
+def handle_decision_batch(decisions):
+    """COMMIT/ABORT many transactions in one frame: [{"txid": ..., "decision": "COMMIT"|"ABORT"}, ...]"""
+    commits = [d["txid"] for d in decisions if d["decision"] == "COMMIT"]
+    aborts = [d["txid"] for d in decisions if d["decision"] != "COMMIT"]
+    if wal:
+        records = [{"op": "COMMIT", "txid": t} for t in commits if t in staged_data]
+        records += [{"op": "ABORT", "txid": t} for t in aborts if t in staged_data]
+        if records:
+            wal.append_many(records, sync=bool(commits))
 
-        conn.sendall(json.dumps(resp).encode())
+    for txid in commits:
+        finish(txid, commit=True)
+    for txid in aborts:
+        finish(txid, commit=False)
+
+    print(f"[batch] {len(commits)} committed, {len(aborts)} aborted")
+    return {"type": "ACK", "msg": f"{len(commits)} committed, {len(aborts)} aborted"}
+
+def handle_get(msg):
+    """GET one key, MGET several, or SCAN a key prefix at the latest committed snapshot"""
+    t = msg["type"]
+    if t == "GET":
+        ts, values = store.read_many([msg["key"]])
+        return {"type": "VALUE", "key": msg["key"], "value": values.get(msg["key"]), "ts": ts}
+    if t == "MGET":
+        ts, values = store.read_many(msg["keys"])
+    else:
+        ts, values = store.scan(msg.get("prefix", ""), msg.get("limit"))
+    return {"type": "VALUES", "values": values, "ts": ts}
+
+def handle_stats():
+    with table_lock:
+        resp = {"type": "STATS", "keys": len(db), "in_doubt": sorted(staged_data)}
+    resp["locks"] = locks.stats()
+    resp["mvcc"] = store.stats()
+    resp["wal"] = wal.stats() if wal else None
+    with connections_lock:
+        resp["connections"] = dict(connections)
+    return resp
+
+def dispatch(msg):
+    t = msg.get("type")
+    txid = msg.get("txid")
+
+    if t == "PREPARE":
+        return handle_prepare(txid, msg["writes"], msg.get("ts"))
+    elif t == "COMMIT":
+        return handle_commit(txid)
+    elif t == "ABORT":
+        return handle_abort(txid)
+    elif t == "PREPARE_BATCH":
+        return handle_prepare_batch(msg["txns"])
+    elif t == "DECISION_BATCH":
+        return handle_decision_batch(msg["decisions"])
+    elif t in ("GET", "MGET", "SCAN"):
+        return handle_get(msg)
+    elif t == "STATS":
+        return handle_stats()
+    return {"type": "ERROR", "msg": "unknown"}
+
+# Accepted connections by kind: one-shot JSON requests vs. persistent framed sessions
+connections = {"legacy": 0, "sessions": 0}
+connections_lock = threading.Lock()
+
+# Session requests run off the reader thread: PREPAREs that may wait for a lock in one pool and
+# decisions (which release locks) in another, so a COMMIT never queues behind the PREPAREs it would
+# wake. Decisions still run in parallel so their WAL records share fsyncs.
+prepare_executor = ThreadPoolExecutor(max_workers=128, thread_name_prefix="prepare")
+decision_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="decision")
+
+def handle_client(conn, addr):
+    """Legacy one-shot request: one JSON object in, one out, then close"""
+    try:
+        conn.sendall(json.dumps(dispatch(recv_json(conn))).encode())
     except Exception as e:
         print("participant err:", e)
     finally:
         conn.close()
 
-def run_server(host, port):
+def handle_session(conn, addr):
+    """Persistent session: length-prefixed requests tagged {"id": n}, answered as each finishes"""
+    write_lock = threading.Lock()
+
+    def serve(msg):
+        try:
+            resp = dispatch(msg)
+        except Exception as e:
+            resp = {"type": "ERROR", "msg": str(e)}
+        resp["id"] = msg.get("id")
+        with write_lock:
+            try:
+                send_frame(conn, resp)
+            except OSError:
+                pass  # coordinator went away; it treats the call as unanswered
+
+    try:
+        while True:
+            msg = recv_frame(conn)
+            if msg is None:
+                break
+            t = msg.get("type")
+            if t == "PREPARE":
+                prepare_executor.submit(serve, msg)
+            elif t in ("COMMIT", "ABORT", "PREPARE_BATCH", "DECISION_BATCH"):
+                decision_executor.submit(serve, msg)  # batches never wait for locks
+            else:
+                serve(msg)  # reads and STATS never block
+    except (OSError, ValueError) as e:
+        print("session err:", e)
+    finally:
+        conn.close()
+
+def handle_connection(conn, addr):
+    """A legacy request starts with '{'; a session starts with a frame length (never that large)"""
+    try:
+        first = conn.recv(1, socket.MSG_PEEK)
+    except OSError:
+        first = b""
+    if not first:
+        conn.close()
+        return
+    kind = "legacy" if first == b"{" else "sessions"
+    with connections_lock:
+        connections[kind] += 1
+    if kind == "legacy":
+        handle_client(conn, addr)
+    else:
+        handle_session(conn, addr)
+
+def run_server(host, port, wal_path=None, lock_wait=DEFAULT_LOCK_WAIT):
+    global wal
+    if lock_wait > MAX_LOCK_WAIT:
+        print(f"--lock-wait {lock_wait} s would outlast the coordinator's timeout; using {MAX_LOCK_WAIT} s")
+        lock_wait = MAX_LOCK_WAIT
+    locks.max_wait = lock_wait
+    if wal_path:
+        recover(wal_path)
+        wal = WriteAheadLog(wal_path)
+
     print(f"\nParticipant running on {host}:{port}\n")
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # restart on the same port right away
     s.bind((host, port))
     s.listen(10)
     while True:
         c, a = s.accept()
-        threading.Thread(target=handle_client, args=(c,a),daemon=True).start()
+        threading.Thread(target=handle_connection, args=(c,a),daemon=True).start()
 
 if __name__ == "__main__":
     p = argparse.ArgumentParser()
     p.add_argument("--host", default="127.0.0.1")
     p.add_argument("--port", required=True)
+    p.add_argument("--wal", help="write-ahead log file; state survives restarts (omit for memory only)")
+    p.add_argument("--lock-wait", type=float, default=DEFAULT_LOCK_WAIT, help=f"max seconds a PREPARE waits for a lock (at most {MAX_LOCK_WAIT})")
     args = p.parse_args()
-    run_server(args.host, int(args.port))
+    run_server(args.host, int(args.port), args.wal, args.lock_wait)